@@ -1,10 +1,20 @@
 import sqlite3
+import importlib.util
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import threading
+from collections import OrderedDict
+import diskcache
+import numpy as np
 import pandas as pd
 import dash
-from dash import dcc, html, Input, Output, State, callback_context
+from dash import dcc, html, Input, Output, State, callback_context, DiskcacheManager
 import plotly.graph_objs as go
+from plotly.colors import qualitative
 import networkx as nx
 import os
+from flask import jsonify, request
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -14,25 +24,681 @@ api_key = os.getenv("OPEN_AI_SECRET_KEY")
 ingestion_model = os.getenv("INGESTION_MODEL")
 client = OpenAI(api_key=api_key) if api_key else None
 
+# Slow callbacks (layout, LLM summary, timeline) run as background jobs whose
+# results are stored in a disk cache. At most MAX_BACKGROUND_JOBS job processes
+# exist at the same time; later jobs wait in a queue until one finishes.
+CALLBACK_CACHE_DIR = os.path.join("data", "callback-cache")
+CALLBACK_RESULT_EXPIRE = 600
+MAX_BACKGROUND_JOBS = int(os.getenv("MAX_BACKGROUND_JOBS", "4"))
+
+# Limits for one POST to /api/interactions.
+MAX_BATCH_LISTS = 1000
+MAX_MEDICATIONS_PER_LIST = 100
+
+# The network view serves the DDI_GRAPH_BACKBONE edges when the graph build
+# wrote them. Set USE_FULL_GRAPH=1 in .env to serve every DDI_GRAPH edge.
+USE_FULL_GRAPH = os.getenv("USE_FULL_GRAPH", "0") == "1"
+
+# Network view: neighbors shown per selected drug, marker sizes (scaled by
+# weighted degree) and the palette cycled over DDI_NODES community labels.
+MAX_NETWORK_NEIGHBORS = 20
+NODE_SIZE_RANGE = (8, 30)
+COMMUNITY_COLORS = qualitative.Dark24
+
+# ID columns of vwEventDrugReaction (data/fda_data.db) held as categoricals over
+# the names in their dictionary table, so a category code is the ID itself and
+# names are only decoded when a figure is drawn.
+EVENT_DICTIONARIES = {
+    "drug_id": ("drug", "DRUG_DICT", "drug"),
+    "reaction_id": ("reaction", "REACTION_DICT", "reaction"),
+    "indication_id": ("drugindication", "INDICATION_DICT", "indication"),
+}
+# FAERS patient.patientsex codes.
+PATIENT_SEX_LABELS = ["Unknown", "Male", "Female"]
+SEVERITY_COLORS = ["#fee8c8", "#fdbb84", "#e34a33", "#b30000"]
+
+
+def table_exists(conn, table):
+    return (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        is not None
+    )
+
+
+def load_graph_edges(conn, table="DDI_GRAPH"):
+    """
+    Load an edge table (DDI_GRAPH or DDI_GRAPH_BACKBONE) with integer drug IDs
+    and the DRUG_DICT names they decode to.
+    """
+    edges_df = pd.read_sql_query(
+        f"SELECT drug_a, drug_b, weight, mean_severity FROM {table}", conn
+    )
+    if table_exists(conn, "DRUG_DICT"):
+        drug_names = pd.read_sql_query(
+            "SELECT drug_id, drug FROM DRUG_DICT", conn, index_col="drug_id"
+        )["drug"]
+    else:
+        # graphs built before DRUG_DICT existed store drug names directly; number
+        # them in name order over DDI_GRAPH so every edge table agrees
+        drug_names = pd.read_sql_query(
+            "SELECT drug_a AS drug FROM DDI_GRAPH UNION "
+            "SELECT drug_b FROM DDI_GRAPH ORDER BY drug",
+            conn,
+        )["drug"]
+        name_index = pd.Index(drug_names)
+        edges_df["drug_a"] = name_index.get_indexer(edges_df["drug_a"])
+        edges_df["drug_b"] = name_index.get_indexer(edges_df["drug_b"])
+    edges_df["weight"] = edges_df["weight"].astype(np.int32)
+    return edges_df, drug_names
+
+
+def load_reactions(conn, chunksize=250_000):
+    """
+    Read vwEventDrugReaction, built by data-normalizer.py, keeping its drug,
+    reaction and indication IDs as categorical codes over the *_DICT names.
+    """
+    categories = {
+        column: pd.read_sql_query(
+            f"SELECT {name} FROM {table} ORDER BY {column}", conn
+        )[name]
+        for column, (_, table, name) in EVENT_DICTIONARIES.items()
+    }
+    query = (
+        "SELECT drug_id, reaction_id, indication_id, patientsex, severity, "
+        "patientonsetage, receiptdate FROM vwEventDrugReaction"
+    )
+    chunks = []
+    for chunk in pd.read_sql_query(query, conn, chunksize=chunksize):
+        for column in EVENT_DICTIONARIES:
+            chunk[column] = chunk[column].fillna(-1).astype(np.int32)
+        chunk["patientsex"] = (
+            pd.to_numeric(chunk["patientsex"], errors="coerce")
+            .fillna(0)
+            .astype(np.int8)
+        )
+        chunk["severity"] = chunk["severity"].astype(np.int8)
+        chunk["patientonsetage"] = pd.to_numeric(
+            chunk["patientonsetage"], errors="coerce"
+        ).astype(np.float32)
+        chunk["receiptdate"] = pd.to_datetime(chunk["receiptdate"], errors="coerce")
+        chunks.append(chunk)
+
+    df = pd.concat(chunks, ignore_index=True)
+    for column, (name, _, _) in EVENT_DICTIONARIES.items():
+        df[name] = pd.Categorical.from_codes(df.pop(column).values, categories[column])
+    df["patientsex"] = pd.Categorical.from_codes(
+        df["patientsex"].where(df["patientsex"].isin([1, 2]), 0).values,
+        PATIENT_SEX_LABELS,
+    )
+    return df
+
+
+def load_edge_periods(conn, n_drugs, table="DDI_GRAPH"):
+    """
+    Load the DDI_GRAPH_PERIODS running totals of the edges in table (DDI_GRAPH
+    or DDI_GRAPH_BACKBONE) as one sorted array of (edge, period) keys, so
+    windowed_weights can answer any period range with two binary searches per
+    edge. Returns None for graphs built without it.
+    """
+    if not table_exists(conn, "DDI_GRAPH_PERIODS"):
+        return None
+    periods_df = pd.read_sql_query(
+        "SELECT period, label FROM DDI_PERIODS ORDER BY period", conn
+    )
+    if periods_df.empty:
+        return None
+    query = "SELECT p.drug_a, p.drug_b, p.period, p.cum_weight FROM DDI_GRAPH_PERIODS p"
+    if table != "DDI_GRAPH":
+        query += f" JOIN {table} e ON e.drug_a = p.drug_a AND e.drug_b = p.drug_b"
+    edge_periods_df = pd.read_sql_query(query, conn)
+
+    first_period = int(periods_df["period"].iloc[0])
+    n_periods = len(periods_df)
+    keys = (
+        edge_periods_df["drug_a"].values.astype(np.int64) * n_drugs
+        + edge_periods_df["drug_b"].values
+    ) * n_periods + (edge_periods_df["period"].values - first_period)
+    order = np.argsort(keys, kind="stable")
+    return {
+        "periods": periods_df,
+        "first_period": first_period,
+        "n_periods": n_periods,
+        "n_drugs": n_drugs,
+        "keys": keys[order],
+        "cum_weight": edge_periods_df["cum_weight"].values[order].astype(np.int64),
+    }
+
+
+def windowed_weights(drug_a, drug_b, start, end):
+    """
+    Weights of the edges drug_a[i]-drug_b[i] counting only reports received in
+    periods start..end (inclusive): cum_weight at end minus cum_weight before
+    start, looked up by binary search in the sorted (edge, period) keys.
+    """
+    n_periods = edge_periods["n_periods"]
+    drug_a = np.asarray(drug_a, dtype=np.int64)
+    drug_b = np.asarray(drug_b, dtype=np.int64)
+    edge_base = (
+        np.minimum(drug_a, drug_b) * edge_periods["n_drugs"]
+        + np.maximum(drug_a, drug_b)
+    ) * n_periods
+
+    def cum_weight_at(offset):
+        if offset < 0:
+            return np.zeros(len(edge_base), dtype=np.int64)
+        offset = min(offset, n_periods - 1)
+        pos = np.searchsorted(edge_periods["keys"], edge_base + offset, side="right")
+        pos = np.maximum(pos - 1, 0)
+        found = edge_periods["keys"][pos] - edge_base
+        valid = (found >= 0) & (found <= offset)
+        return np.where(valid, edge_periods["cum_weight"][pos], 0)
+
+    first_period = edge_periods["first_period"]
+    return cum_weight_at(end - first_period) - cum_weight_at(start - first_period - 1)
+
+
+def selected_window(period_range):
+    """
+    (start, end) period ordinals for the date-range control, or None when it
+    covers every period (or the graph has no period tables).
+    """
+    if edge_periods is None or not period_range:
+        return None
+    periods = edge_periods["periods"]["period"]
+    start, end = period_range
+    if start <= periods.iloc[0] and end >= periods.iloc[-1]:
+        return None
+    return start, end
+
+
+def load_node_metrics(conn, drug_names):
+    """
+    DDI_NODES degree, weighted degree, PageRank and community per drug ID, with
+    zeros (community -1) for drugs that have none or for graphs built before
+    these metrics were stored.
+    """
+    metric_columns = ["degree", "weighted_degree", "pagerank", "community"]
+    columns = set()
+    if table_exists(conn, "DDI_NODES"):
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(DDI_NODES)")}
+    if set(metric_columns) <= columns:
+        nodes_df = pd.read_sql_query(
+            f"SELECT drug, {', '.join(metric_columns)} FROM DDI_NODES",
+            conn,
+            index_col="drug",
+        )
+        if not pd.api.types.is_integer_dtype(nodes_df.index):
+            # node tables of graphs without DRUG_DICT are keyed by name
+            nodes_df.index = pd.Index(drug_names.values).get_indexer(nodes_df.index)
+    else:
+        nodes_df = pd.DataFrame(columns=metric_columns, dtype=np.float64)
+
+    nodes_df = nodes_df.reindex(drug_names.index)
+    nodes_df[["degree", "weighted_degree", "pagerank"]] = nodes_df[
+        ["degree", "weighted_degree", "pagerank"]
+    ].fillna(0)
+    nodes_df["community"] = nodes_df["community"].fillna(-1).astype(np.int64)
+
+    # marker size on a log scale of weighted degree
+    log_degree = np.log1p(nodes_df["weighted_degree"].values.astype(np.float64))
+    smallest, largest = NODE_SIZE_RANGE
+    scale = log_degree.max() if len(log_degree) and log_degree.max() > 0 else 1.0
+    nodes_df["size"] = smallest + (largest - smallest) * log_degree / scale
+    return nodes_df
+
+
+def rank_neighbors(neighbors, weights, limit=MAX_NETWORK_NEIGHBORS):
+    """
+    Up to limit neighbors with weight > 0, heaviest edge first, ties going to
+    the neighbor with the higher precomputed PageRank.
+    """
+    neighbors = np.asarray(neighbors, dtype=np.int64)
+    weights = np.asarray(weights)
+    order = np.lexsort((-node_pagerank[neighbors], -weights))
+    order = order[weights[order] > 0][:limit]
+    return neighbors[order].tolist()
+
+
+class BoundedDiskcacheManager(DiskcacheManager):
+    """
+    DiskcacheManager that forks at most max_jobs job processes at a time.
+    Jobs beyond that wait in a queue in the server process, and a launcher
+    thread forks them as running jobs finish. Jobs are tracked by an ID
+    handed out at submission, so a superseded job still in the queue is
+    cancelled by dropping it, without ever forking. Jobs with the same inputs
+    share a result key: a stored result goes to every job waiting on that
+    key (a queued one then never forks) and is deleted once none are left.
+    A SQLite connection does not survive a fork made while another thread is
+    inside a cache transaction, so the server process only touches the cache
+    while holding the same lock as the launcher.
+
+    The queue and the job processes belong to one server process, so the app
+    must be served by a single process (threads are fine): the first process
+    to submit a job records itself in the cache, and a second live server
+    process that submits or polls a job gets an error instead of empty panels.
+    This overrides internals of dash 4.4 (call_job_fn, job_running,
+    get_result, handle, _make_progress_key), which requirements.txt pins.
+    """
+
+    SERVER_KEY = "bounded-manager-server"
+
+    def __init__(self, cache, max_jobs, expire=None):
+        super().__init__(cache, expire=expire)
+        self.max_jobs = max_jobs
+        self.job_keys = {}
+        self.queued = OrderedDict()
+        self.processes = {}
+        self.job_ids = itertools.count(1)
+        self.lock = threading.RLock()
+        self.launcher = None
+        self.wakeup_reader, self.wakeup_writer = multiprocessing.Pipe(duplex=False)
+
+    def claim_server(self):
+        # pylint: disable-next=import-outside-toplevel,import-error
+        import psutil
+
+        server = (os.getpid(), psutil.Process().create_time())
+        with self.handle.transact():
+            owner = self.handle.get(self.SERVER_KEY)
+            if owner is not None and owner != server:
+                pid, create_time = owner
+                if (
+                    psutil.pid_exists(pid)
+                    and psutil.Process(pid).create_time() == create_time
+                ):
+                    raise RuntimeError(
+                        f"Background callbacks are already served by process "
+                        f"{pid}; serve the app from a single process."
+                    )
+            self.handle.set(self.SERVER_KEY, server)
+
+    def call_job_fn(self, key, job_fn, args, context):
+        with self.lock:
+            if self.launcher is None:
+                self.claim_server()
+                self.launcher = threading.Thread(target=self.launch_jobs, daemon=True)
+                self.launcher.start()
+            job = f"{os.getpid()}-{next(self.job_ids)}"
+            self.job_keys[job] = key
+            self.queued[job] = (job_fn, args, context)
+        self.wakeup_writer.send(None)
+        return job
+
+    def launch_jobs(self):
+        # pylint: disable-next=import-outside-toplevel,import-error
+        from multiprocess import Process
+
+        while True:
+            with self.lock:
+                for job, process in list(self.processes.items()):
+                    if not process.is_alive():
+                        del self.processes[job]
+                while self.queued and len(self.processes) < self.max_jobs:
+                    job, (job_fn, args, context) = self.queued.popitem(last=False)
+                    key = self.job_keys[job]
+                    process = Process(
+                        target=job_fn,
+                        args=(key, self._make_progress_key(key), args, context),
+                    )
+                    process.start()
+                    self.processes[job] = process
+                sentinels = [process.sentinel for process in self.processes.values()]
+            # sleep until a job is submitted or a job process exits
+            ready = multiprocessing.connection.wait(sentinels + [self.wakeup_reader])
+            if self.wakeup_reader in ready:
+                while self.wakeup_reader.poll():
+                    self.wakeup_reader.recv()
+
+    def job_running(self, job):
+        if not job.startswith(f"{os.getpid()}-"):
+            raise RuntimeError(
+                f"Background job {job} was started by another server process; "
+                "serve the app from a single process."
+            )
+        with self.lock:
+            key = self.job_keys.get(job)
+            if key is None:
+                return False
+            if job in self.queued:
+                return True
+            process = self.processes.get(job)
+            if process is not None and process.is_alive():
+                return True
+            # a job that stored its result after the poll looked for it counts
+            # as running, so the next poll collects the result
+            return self.result_ready(key)
+
+    def terminate_job(self, job):
+        with self.lock:
+            key = self.job_keys.pop(job, None)
+            if key is not None and key not in self.job_keys.values():
+                self.clear_cache_entry(key)
+            if self.queued.pop(job, None) is not None:
+                return
+            process = self.processes.get(job)
+        if process is not None:
+            # killed and reaped through the Process object, so that is_alive()
+            # still sees the exit (psutil would reap it behind its back)
+            process.kill()
+            process.join(1)
+
+    def terminate_unhealthy_job(self, job):
+        # the launcher thread reaps job processes that have exited
+        return False
+
+    def get_progress(self, key):
+        with self.lock:
+            return super().get_progress(key)
+
+    def result_ready(self, key):
+        with self.lock:
+            return super().result_ready(key)
+
+    def get_result(self, key, job):
+        with self.lock:
+            result = self.handle.get(key, self.UNDEFINED)
+            if result is self.UNDEFINED:
+                return self.UNDEFINED
+            self.clear_cache_entry(self._make_progress_key(key))
+            # also deletes the result once no other job waits on its key
+            self.terminate_job(job)
+            return result
+
+    def get_updated_props(self, key):
+        with self.lock:
+            return super().get_updated_props(key)
+
+    def get_or_create_signing_secret(self, generate):
+        with self.lock:
+            return super().get_or_create_signing_secret(generate)
+
+
+def load_script(script_name):
+    module_name = os.path.splitext(script_name)[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(module_name, script_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def normalize_drug_name(name):
+    return " ".join(str(name).upper().strip(" .").split())
+
+
+def load_name_index(conn, drug_names):
+    """
+    Normalized drug name -> drug ID, from DRUG_DICT plus the raw names in
+    DRUG_ALIASES when the graph has them, and the same names keyed by the
+    normalizer's drug_name_key (no strengths, dosage forms or salt words) for
+    names that do not match as written.
+    """
+    names = []
+    if table_exists(conn, "DRUG_ALIASES"):
+        aliases = pd.read_sql_query(
+            "SELECT raw_name, drug_id FROM DRUG_ALIASES", conn
+        )
+        names.extend(zip(aliases["raw_name"], aliases["drug_id"].tolist()))
+    # canonical names come last, so they win over raw names that collide
+    names.extend(zip(drug_names.values, drug_names.index.tolist()))
+
+    name_index = {normalize_drug_name(name): drug for name, drug in names}
+    key_index = {data_normalizer.drug_name_key(name): drug for name, drug in names}
+    return name_index, key_index
+
+
+def resolve_drug_name(name):
+    drug = drug_name_index.get(normalize_drug_name(name))
+    if drug is None:
+        drug = drug_key_index.get(data_normalizer.drug_name_key(name))
+    return drug
+
+
+def load_pair_index(conn, edges_df, n_drugs):
+    """
+    Hash index over the DDI_GRAPH edges keyed by min(a, b) * n_drugs + max(a, b).
+    Top reactions per edge (DDI_PAIR_TOP_REACTIONS) are kept as flat arrays
+    with per-edge offsets.
+    """
+    drug_a = edges_df["drug_a"].values.astype(np.int64)
+    drug_b = edges_df["drug_b"].values.astype(np.int64)
+    keys = pd.Index(
+        np.minimum(drug_a, drug_b) * n_drugs + np.maximum(drug_a, drug_b)
+    )
+    pair_index = {
+        "keys": keys,
+        "n_drugs": n_drugs,
+        "weight": edges_df["weight"].values,
+        "mean_severity": edges_df["mean_severity"].values,
+        "reaction_offsets": np.zeros(len(edges_df) + 1, dtype=np.int64),
+        "reaction": np.zeros(0, dtype=np.int64),
+        "reaction_count": np.zeros(0, dtype=np.int64),
+        "reaction_names": {},
+        "pair_keys": None,
+        "report_count": None,
+    }
+    if table_exists(conn, "DDI_PAIRS"):
+        pairs_df = pd.read_sql_query(
+            "SELECT drug_a, drug_b, report_count FROM DDI_PAIRS", conn
+        )
+        pair_index["pair_keys"] = pd.Index(
+            pairs_df["drug_a"].values.astype(np.int64) * n_drugs
+            + pairs_df["drug_b"].values
+        )
+        pair_index["report_count"] = pairs_df["report_count"].values
+    if not table_exists(conn, "DDI_PAIR_TOP_REACTIONS"):
+        return pair_index
+
+    top_df = pd.read_sql_query(
+        "SELECT drug_a, drug_b, reaction, report_count FROM DDI_PAIR_TOP_REACTIONS",
+        conn,
+    )
+    top_df["row"] = keys.get_indexer(
+        np.minimum(top_df["drug_a"], top_df["drug_b"]).values.astype(np.int64)
+        * n_drugs
+        + np.maximum(top_df["drug_a"], top_df["drug_b"]).values
+    )
+    top_df = top_df[top_df["row"] >= 0].sort_values(
+        ["row", "report_count"], ascending=[True, False]
+    )
+    pair_index["reaction_offsets"] = np.searchsorted(
+        top_df["row"].values, np.arange(len(edges_df) + 1)
+    )
+    pair_index["reaction"] = top_df["reaction"].values
+    pair_index["reaction_count"] = top_df["report_count"].values
+    pair_index["reaction_names"] = (
+        pd.read_sql_query("SELECT reaction_id, reaction FROM REACTION_DICT", conn)
+        .set_index("reaction_id")["reaction"]
+        .to_dict()
+    )
+    return pair_index
+
+
+def get_pair_index():
+    """
+    The interaction API's pair index over every DDI_GRAPH edge. It is built on
+    the first call, so serving the backbone does not load the full edge table
+    at startup.
+    """
+    global pair_index
+    with pair_index_lock:
+        if pair_index is None:
+            conn = sqlite3.connect("data/ddi-graph.db")
+            if serving_full_graph:
+                edges_df = ddi_edges_df
+            else:
+                edges_df, _ = load_graph_edges(conn)
+            pair_index = load_pair_index(conn, edges_df, n_drugs)
+            conn.close()
+    return pair_index
+
+
+def check_medication_lists(medication_lists):
+    """
+    Resolve each list's names to drug IDs and look up every pair of distinct
+    drugs in the pair index, with a single hash lookup for the whole batch.
+    """
+    resolved = []
+    for medications in medication_lists:
+        drugs, unresolved = [], []
+        for name in medications:
+            drug = resolve_drug_name(name)
+            if drug is None:
+                unresolved.append(name)
+            elif drug not in drugs:
+                drugs.append(drug)
+        resolved.append((drugs, unresolved))
+
+    pair_index = get_pair_index()
+    pair_a, pair_b = [], []
+    for drugs, _ in resolved:
+        i, j = np.triu_indices(len(drugs), k=1)
+        pair_a.append(np.asarray(drugs, dtype=np.int64)[i])
+        pair_b.append(np.asarray(drugs, dtype=np.int64)[j])
+    pair_a = np.concatenate(pair_a) if pair_a else np.zeros(0, dtype=np.int64)
+    pair_b = np.concatenate(pair_b) if pair_b else np.zeros(0, dtype=np.int64)
+    pair_keys = np.minimum(pair_a, pair_b) * pair_index["n_drugs"] + np.maximum(
+        pair_a, pair_b
+    )
+    rows = pair_index["keys"].get_indexer(pair_keys)
+
+    weights = np.where(rows >= 0, pair_index["weight"][rows], 0).tolist()
+    if pair_index["pair_keys"] is not None:
+        pair_rows = pair_index["pair_keys"].get_indexer(pair_keys)
+        report_counts = np.where(
+            pair_rows >= 0, pair_index["report_count"][pair_rows], 0
+        ).tolist()
+    else:
+        report_counts = [None] * len(pair_keys)
+    severities = pair_index["mean_severity"][rows].tolist()
+    offsets = pair_index["reaction_offsets"]
+    reaction_names = pair_index["reaction_names"]
+
+    results = []
+    position = 0
+    for (drugs, unresolved), medications in zip(resolved, medication_lists):
+        interactions = []
+        for _ in range(len(drugs) * (len(drugs) - 1) // 2):
+            row = rows[position]
+            interaction = {
+                "drug_a": drug_name_lookup[pair_a[position]],
+                "drug_b": drug_name_lookup[pair_b[position]],
+                "weight": weights[position],
+                "report_count": report_counts[position],
+                "mean_severity": None,
+                "top_reactions": [],
+            }
+            if row >= 0:
+                start, end = offsets[row], offsets[row + 1]
+                interaction["mean_severity"] = severities[position]
+                interaction["top_reactions"] = [
+                    {
+                        "reaction": reaction_names.get(reaction, str(reaction)),
+                        "report_count": count,
+                    }
+                    for reaction, count in zip(
+                        pair_index["reaction"][start:end].tolist(),
+                        pair_index["reaction_count"][start:end].tolist(),
+                    )
+                ]
+            interactions.append(interaction)
+            position += 1
+        results.append(
+            {
+                "medications": medications,
+                "resolved": [drug_name_lookup[drug] for drug in drugs],
+                "unresolved": unresolved,
+                "interactions": interactions,
+            }
+        )
+    return results
+
+
+def category_mask(series, values):
+    """
+    Boolean mask of rows whose category is one of values, compared as codes.
+    """
+    codes = series.cat.categories.get_indexer(pd.Index(values))
+    return np.isin(series.cat.codes.values, codes[codes >= 0])
+
+
+def decoded_counts(series):
+    """
+    value_counts on the integer codes of a categorical, decoded to names.
+    """
+    codes = series.cat.codes
+    counts = codes[codes >= 0].value_counts()
+    counts.index = series.cat.categories[counts.index]
+    return counts
+
+
+# data-normalizer.py is a script, so its name keys are loaded from the file
+data_normalizer = load_script("data-normalizer.py")
+
 conn_graph = sqlite3.connect("data/ddi-graph.db")
-ddi_edges_df = pd.read_sql_query("SELECT * FROM DDI_GRAPH", conn_graph)
+serving_full_graph = USE_FULL_GRAPH or not table_exists(
+    conn_graph, "DDI_GRAPH_BACKBONE"
+)
+served_edge_table = "DDI_GRAPH" if serving_full_graph else "DDI_GRAPH_BACKBONE"
+ddi_edges_df, drug_names = load_graph_edges(conn_graph, served_edge_table)
+n_drugs = int(drug_names.index.max()) + 1
+edge_periods = load_edge_periods(conn_graph, n_drugs, served_edge_table)
+drug_name_index, drug_key_index = load_name_index(conn_graph, drug_names)
+node_metrics = load_node_metrics(conn_graph, drug_names)
 conn_graph.close()
 
-conn_prj = sqlite3.connect("data/prj174.db")
-reactions_df = pd.read_sql_query("SELECT * FROM vwEventDrugReaction", conn_prj)
-conn_prj.close()
+# built on the first API call, see get_pair_index
+pair_index = None
+pair_index_lock = threading.Lock()
+
+node_pagerank = node_metrics["pagerank"].reindex(range(n_drugs), fill_value=0).values
 
-drug_reactions_df = reactions_df.copy(deep=True)
+drug_name_lookup = drug_names.to_dict()
 
-indications = reactions_df["drugindication"].dropna().unique()
-indication_options = [{"label": ind, "value": ind} for ind in indications]
+conn_fda = sqlite3.connect("data/fda_data.db")
+reactions_df = load_reactions(conn_fda)
+conn_fda.close()
+
+indication_options = [
+    {"label": ind, "value": code}
+    for code, ind in enumerate(reactions_df["drugindication"].cat.categories)
+]
 
 network_drug_options = [
-    {"label": drug, "value": drug}
+    {"label": drug_names[drug], "value": drug}
     for drug in pd.unique(ddi_edges_df[["drug_a", "drug_b"]].values.ravel("K"))
+    .tolist()
 ]
 
-app = dash.Dash(__name__)
+if edge_periods is not None:
+    period_values = edge_periods["periods"]["period"].tolist()
+    period_labels = edge_periods["periods"]["label"].tolist()
+    mark_step = max(1, len(period_values) // 10)
+    period_slider = dcc.RangeSlider(
+        id="period-range",
+        min=period_values[0],
+        max=period_values[-1],
+        step=1,
+        value=[period_values[0], period_values[-1]],
+        marks={
+            period: label
+            for period, label in list(zip(period_values, period_labels))[::mark_step]
+        },
+        allowCross=False,
+    )
+else:
+    period_slider = dcc.RangeSlider(
+        id="period-range", min=0, max=0, value=[0, 0], disabled=True
+    )
+
+callback_cache = diskcache.Cache(CALLBACK_CACHE_DIR)
+background_callback_manager = BoundedDiskcacheManager(
+    callback_cache, MAX_BACKGROUND_JOBS, expire=CALLBACK_RESULT_EXPIRE
+)
+
+app = dash.Dash(__name__, background_callback_manager=background_callback_manager)
+server = app.server
 
 app.layout = html.Div(
     [
@@ -61,8 +727,11 @@ app.layout = html.Div(
             style={"display": "flex", "flex-direction": "row"},
         ),
         html.H3("Reaction Summary"),
+        html.Div(id="reaction-summary-status", style={"color": "#888"}),
         html.Div(
-            id="reaction-summary", style={"whiteSpace": "pre-wrap", "marginTop": "10px"}
+            "Click on a side effect bar to see the summary.",
+            id="reaction-summary",
+            style={"whiteSpace": "pre-wrap", "marginTop": "10px"},
         ),
         html.Div(
             [
@@ -90,6 +759,8 @@ app.layout = html.Div(
             multi=True,
         ),
         html.Button(id="submit-button", n_clicks=0, children="Submit"),
+        html.Div([period_slider], style={"marginTop": "10px"}),
+        html.Div(id="network-status", style={"color": "#888"}),
         dcc.Graph(id="network-graph"),
         dcc.Graph(id="severity-timeline"),
     ]
@@ -98,10 +769,15 @@ app.layout = html.Div(
 G = nx.Graph()
 
 unique_drugs = pd.unique(ddi_edges_df[["drug_a", "drug_b"]].values.ravel("K"))
-G.add_nodes_from(unique_drugs)
+G.add_nodes_from(unique_drugs.tolist())
 
-for idx, row in ddi_edges_df.iterrows():
-    G.add_edge(row["drug_a"], row["drug_b"], weight=row["weight"])
+G.add_weighted_edges_from(
+    zip(
+        ddi_edges_df["drug_a"].tolist(),
+        ddi_edges_df["drug_b"].tolist(),
+        ddi_edges_df["weight"].tolist(),
+    )
+)
 
 
 pos = {}
@@ -118,14 +794,16 @@ pos = {}
     [Input("indication-dropdown", "value"), Input("bar-chart", "clickData")],
 )
 def update_bar_charts(selected_indication, drug_click_data):
-    if selected_indication:
-        filtered_df = drug_reactions_df[
-            drug_reactions_df["drugindication"] == selected_indication
+    if selected_indication is not None:
+        filtered_df = reactions_df[
+            reactions_df["drugindication"].cat.codes.values == selected_indication
+        ]
+        selected_indication = reactions_df["drugindication"].cat.categories[
+            selected_indication
         ]
 
         drug_counts = (
-            filtered_df["medicinalproduct"]
-            .value_counts()
+            decoded_counts(filtered_df["drug"])
             .sort_values(ascending=False)
             .head(20)
         )
@@ -148,14 +826,14 @@ def update_bar_charts(selected_indication, drug_click_data):
         if drug_click_data and "points" in drug_click_data:
             clicked_drug = drug_click_data["points"][0]["y"]
             side_effects_df = filtered_df[
-                filtered_df["medicinalproduct"] == clicked_drug
+                category_mask(filtered_df["drug"], [clicked_drug])
             ]
 
         else:
             side_effects_df = filtered_df
             clicked_drug = None
 
-        reaction_counts = side_effects_df["reaction"].value_counts()
+        reaction_counts = decoded_counts(side_effects_df["reaction"])
 
         top_reactions = reaction_counts.head(10)[::-1]
         bottom_reactions = reaction_counts.tail(10)[::-1]
@@ -188,7 +866,7 @@ def update_bar_charts(selected_indication, drug_click_data):
             ),
         )
 
-        sex_counts = side_effects_df["patientsex"].value_counts().reset_index()
+        sex_counts = decoded_counts(side_effects_df["patientsex"]).reset_index()
         sex_counts.columns = ["patientsex", "count"]
         sex_fig = go.Figure(
             data=[
@@ -269,6 +947,15 @@ def get_reaction_summary(reaction_name):
         Input("top-reactions-bar-chart", "clickData"),
         Input("bottom-reactions-bar-chart", "clickData"),
     ],
+    background=True,
+    prevent_initial_call=True,
+    running=[
+        (
+            Output("reaction-summary-status", "children"),
+            "Generating summary...",
+            "",
+        ),
+    ],
 )
 def update_reaction_summary(top_click, bottom_click):
     ctx = callback_context
@@ -291,10 +978,16 @@ def update_reaction_summary(top_click, bottom_click):
 
 @app.callback(
     Output("network-graph", "figure"),
-    [Input("submit-button", "n_clicks")],
+    [Input("submit-button", "n_clicks"), Input("period-range", "value")],
     [State("drug-input", "value")],
+    background=True,
+    prevent_initial_call=True,
+    running=[
+        (Output("network-status", "children"), "Computing network layout...", ""),
+        (Output("network-graph", "style"), {"opacity": 0.5}, {"opacity": 1}),
+    ],
 )
-def update_network(n_clicks, selected_drugs):
+def update_network(n_clicks, period_range, selected_drugs):
     global pos
     if n_clicks == 0 or not selected_drugs:
         return go.Figure()
@@ -302,20 +995,35 @@ def update_network(n_clicks, selected_drugs):
     if not isinstance(selected_drugs, list):
         selected_drugs = [selected_drugs]
 
+    window = selected_window(period_range)
+
     subgraph_nodes = set()
     for drug in selected_drugs:
         if drug in G:
             subgraph_nodes.add(drug)
 
-            neighbors = sorted(
-                G[drug].items(), key=lambda item: item[1].get("weight", 1), reverse=True
-            )
-            top_neighbors = [neighbor for neighbor, attrs in neighbors[:20]]
+            neighbors = list(G[drug])
+            if window is None:
+                weights = [G[drug][neighbor]["weight"] for neighbor in neighbors]
+            else:
+                weights = windowed_weights([drug] * len(neighbors), neighbors, *window)
+            top_neighbors = rank_neighbors(neighbors, weights)
             subgraph_nodes.update(top_neighbors)
         else:
-            print(f"Drug {drug} not found in the graph.")
+            print(f"Drug {drug_names.get(drug, drug)} not found in the graph.")
     subgraph = G.subgraph(subgraph_nodes).copy()
 
+    if window is not None:
+        edges = list(subgraph.edges())
+        weights = windowed_weights(
+            [u for u, v in edges], [v for u, v in edges], *window
+        )
+        for (u, v), weight in zip(edges, weights.tolist()):
+            if weight > 0:
+                subgraph[u][v]["weight"] = weight
+            else:
+                subgraph.remove_edge(u, v)
+
     if subgraph.number_of_nodes() == 0:
         print("Subgraph is empty.")
         return go.Figure()
@@ -333,6 +1041,7 @@ def create_network_figure(subgraph, selected_drugs):
     node_y = []
     node_color = []
     node_size = []
+    node_line_color = []
     node_text = []
     hover_text = []
 
@@ -360,19 +1069,28 @@ def create_network_figure(subgraph, selected_drugs):
         x, y = pos[node]
         node_x.append(x)
         node_y.append(y)
-        node_label = node
+        node_label = drug_names[node]
+        metrics = node_metrics.loc[node]
+        community = int(metrics["community"])
+        if community >= 0:
+            color = COMMUNITY_COLORS[community % len(COMMUNITY_COLORS)]
+        else:
+            color = "blue"
         if node in selected_drugs:
-            color = "red"
             text = node_label
-            size = 20
+            line_color = "red"
         else:
-            color = "blue"
             text = ""
-            size = 10
+            line_color = "white"
         node_color.append(color)
-        node_size.append(size)
+        node_size.append(metrics["size"])
+        node_line_color.append(line_color)
         node_text.append(text)
-        hover_text.append(node_label)
+        hover_text.append(
+            f"{node_label}<br>community {community}"
+            f"<br>weighted degree {metrics['weighted_degree']:.0f}"
+            f"<br>PageRank {metrics['pagerank']:.2e}"
+        )
 
     node_trace = go.Scatter(
         x=node_x,
@@ -382,7 +1100,12 @@ def create_network_figure(subgraph, selected_drugs):
         mode="markers+text",
         hoverinfo="text",
         hovertext=hover_text,
-        marker=dict(showscale=False, color=node_color, size=node_size, line_width=2),
+        marker=dict(
+            showscale=False,
+            color=node_color,
+            size=node_size,
+            line=dict(width=2, color=node_line_color),
+        ),
     )
 
     fig = go.Figure(
@@ -401,7 +1124,15 @@ def create_network_figure(subgraph, selected_drugs):
     return fig
 
 
-@app.callback(Output("severity-timeline", "figure"), [Input("drug-input", "value")])
+@app.callback(
+    Output("severity-timeline", "figure"),
+    [Input("drug-input", "value")],
+    background=True,
+    prevent_initial_call=True,
+    running=[
+        (Output("severity-timeline", "style"), {"opacity": 0.5}, {"opacity": 1}),
+    ],
+)
 def update_severity_timeline(selected_drugs):
     if not selected_drugs:
         return go.Figure()
@@ -409,26 +1140,23 @@ def update_severity_timeline(selected_drugs):
     if not isinstance(selected_drugs, list):
         selected_drugs = [selected_drugs]
 
-    mask = drug_reactions_df["medicinalproduct"].isin(selected_drugs)
-    timeline_df = drug_reactions_df[mask].copy()
+    selected_names = drug_names[selected_drugs].tolist()
+    # DRUG_DICT in data/ddi-graph.db is copied from data/fda_data.db, so graph
+    # node IDs are the drug category codes of reactions_df
+    mask = np.isin(reactions_df["drug"].cat.codes.values, selected_drugs)
+    timeline_df = reactions_df.loc[mask, ["receiptdate", "severity"]].copy()
 
-    timeline_df["receiptdate"] = pd.to_datetime(timeline_df["receiptdate"])
     timeline_df["month"] = timeline_df["receiptdate"].dt.to_period("M")
 
-    severity_counts = (
-        timeline_df.groupby(["month", "serious"])["safetyreportid"]
-        .count()
-        .reset_index()
+    pivot_df = (
+        timeline_df.groupby(["month", "severity"])
+        .size()
+        .unstack("severity", fill_value=0)
     )
 
-    pivot_df = severity_counts.pivot(
-        index="month", columns="serious", values="safetyreportid"
-    ).fillna(0)
-
     fig = go.Figure()
 
-    colors = ["#fee8c8", "#fdbb84", "#e34a33"]
-    for severity, color in zip(sorted(timeline_df["serious"].unique()), colors):
+    for severity, color in enumerate(SEVERITY_COLORS):
         if severity in pivot_df.columns:
             fig.add_trace(
                 go.Bar(
@@ -440,7 +1168,7 @@ def update_severity_timeline(selected_drugs):
             )
 
     fig.update_layout(
-        title=f'Monthly FAERS Reports by Severity for {", ".join(selected_drugs)}',
+        title=f'Monthly FAERS Reports by Severity for {", ".join(selected_names)}',
         xaxis_title="Month-Year of Report",
         yaxis_title="Count of Reports",
         barmode="stack",
@@ -451,5 +1179,49 @@ def update_severity_timeline(selected_drugs):
     return fig
 
 
+@app.server.route("/api/interactions", methods=["POST"])
+def interactions_api():
+    """
+    Batch interaction check. Body: {"medication_lists": [["drug", ...], ...]}.
+    Returns, per list, every pair of resolved drugs with its DDI_GRAPH weight
+    (0 when the pair was never reported together), its DDI_PAIRS report
+    count, mean severity and most reported reactions.
+    """
+    payload = request.get_json(silent=True)
+    medication_lists = (
+        payload.get("medication_lists") if isinstance(payload, dict) else None
+    )
+    if not isinstance(medication_lists, list) or not all(
+        isinstance(medications, list)
+        and all(isinstance(name, str) for name in medications)
+        for medications in medication_lists
+    ):
+        return (
+            jsonify(
+                {
+                    "error": 'Expected a JSON body of the form '
+                    '{"medication_lists": [["drug name", ...], ...]}.'
+                }
+            ),
+            400,
+        )
+    if len(medication_lists) > MAX_BATCH_LISTS:
+        return (
+            jsonify({"error": f"At most {MAX_BATCH_LISTS} lists per request."}),
+            400,
+        )
+    if any(
+        len(medications) > MAX_MEDICATIONS_PER_LIST for medications in medication_lists
+    ):
+        return (
+            jsonify(
+                {"error": f"At most {MAX_MEDICATIONS_PER_LIST} medications per list."}
+            ),
+            400,
+        )
+
+    return jsonify({"results": check_medication_lists(medication_lists)})
+
+
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    app.run(debug=True)
@@ -1,6 +1,7 @@
 import pandas as pd
 import json
 import os
+import re
 import sqlite3
 import argparse
 from dotenv import load_dotenv
@@ -37,6 +38,382 @@ def clean_dataframe(df):
                 df[col] = df[col].apply(lambda x: json.dumps(x) if isinstance(x, (dict, list)) else x)
     return df
 
+DRUG_NAME_NOISE_WORDS = {
+    "NOS", "NGX", "CON", "UNK", "UNS", "UNKNOWN", "UNSPECIFIED", "BLIND", "USP",
+    "DOSE", "DOSAGE", "FORM", "FORMS", "UNIT", "UNITS", "MG", "MCG", "UG", "G",
+    "ML", "IU", "MILLIGRAM", "MILLIGRAMS", "FORMULATION",
+}
+
+DRUG_FORM_WORDS = {
+    "TABLET", "TABLETS", "TAB", "TABS", "CAPSULE", "CAPSULES", "CAP", "CAPS",
+    "INJECTION", "INJ", "SOLUTION", "SUSPENSION", "SYRUP", "DROPS", "POWDER",
+    "CREAM", "OINTMENT", "PATCH", "VIAL", "PEN", "ORAL", "IV", "CHEWABLE", "FILM",
+    "COATED", "EXTENDED", "SUSTAINED", "DELAYED", "RELEASE", "ER", "XR", "XL",
+    "SR", "CR", "ODT",
+}
+
+DRUG_SALT_WORDS = {
+    "HCL", "HYDROCHLORIDE", "SODIUM", "DISODIUM", "POTASSIUM", "CALCIUM",
+    "MAGNESIUM", "SULFATE", "SULPHATE", "MESYLATE", "MALEATE", "TARTRATE",
+    "SUCCINATE", "ACETATE", "CITRATE", "BESYLATE", "FUMARATE", "PHOSPHATE",
+    "BROMIDE", "HYDROBROMIDE", "CHLORIDE", "NITRATE", "HYCLATE", "MONOHYDRATE",
+    "DIHYDRATE", "TRIHYDRATE",
+}
+
+# Words that describe a product rather than name a drug. A parenthesized group
+# made only of these (and salt words) is not used as the drug name.
+DRUG_DESCRIPTOR_WORDS = {
+    "MIXED", "SALT", "SALTS", "RDNA", "ORIGIN", "GENERIC", "BRAND", "INGREDIENT",
+    "INGREDIENTS",
+}
+
+# A name without a generic_name is folded into a canonical drug reported at
+# least FUZZY_MIN_FREQUENCY_RATIO times more often only when the two names have
+# the same words but one, and those two words are letters only, at least
+# FUZZY_MIN_LENGTH long and differ by one added or dropped letter or one vowel
+# written as another (so PREDNISONE stays apart from PREDNISOLONE, VITAMIN B2
+# from VITAMIN D2, and short look-alike brands such as FLOMOX and FLOMAX apart).
+FUZZY_VOWELS = set("AEIOUY")
+FUZZY_MIN_LENGTH = 8
+FUZZY_MIN_FREQUENCY_RATIO = 5
+
+
+def _drug_name_tokens(text):
+    tokens = [
+        token
+        for token in re.sub(r"[^A-Z0-9]+", " ", text).split()
+        if not token[0].isdigit()
+        and token not in DRUG_NAME_NOISE_WORDS
+        and token not in DRUG_FORM_WORDS
+    ]
+    tokens = list(dict.fromkeys(tokens))
+    # "LEVOTHYROXINE SODIUM" -> "LEVOTHYROXINE", but keep "POTASSIUM CHLORIDE"
+    while (
+        len(tokens) > 1
+        and tokens[-1] in DRUG_SALT_WORDS
+        and tokens[-2] not in DRUG_SALT_WORDS
+    ):
+        tokens.pop()
+    return " ".join(tokens)
+
+
+def _outer_groups(text):
+    """
+    Split a name into its text outside parentheses and its outermost
+    parenthesized groups. Nested groups are dropped from their outer group and
+    an unclosed group (a name truncated by FAERS) is dropped entirely.
+    """
+    outside, groups, current, depth = [], [], [], 0
+    for char in text:
+        if char == "(":
+            depth += 1
+            (outside if depth == 1 else current).append(" ")
+        elif char == ")" and depth:
+            depth -= 1
+            if depth == 0:
+                groups.append("".join(current))
+                current = []
+        elif depth == 0:
+            outside.append(char)
+        elif depth == 1:
+            current.append(char)
+    return "".join(outside), groups
+
+
+def drug_name_key(name):
+    """
+    Normalized lookup key for a drug name. FAERS names are usually written as
+    "BRAND (ACTIVE INGREDIENT)", so the first outermost parenthesized group is
+    preferred over the text around it, unless it only describes the product
+    (e.g. "(MIXED SALTS)").
+    """
+    text = str(name).upper()
+    text = re.sub(r"/\d+/", " ", text)
+    text = re.sub(r"\^[^^]*\^", " ", text)
+
+    outside, groups = _outer_groups(text)
+    for candidate in groups[:1] + [outside]:
+        key = _drug_name_tokens(candidate)
+        if set(key.split()) - DRUG_DESCRIPTOR_WORDS - DRUG_SALT_WORDS:
+            return key
+    return _drug_name_tokens(outside) or text.strip()
+
+
+def _is_misspelling(word, other):
+    if len(word) == len(other):
+        changed = [pair for pair in zip(word, other) if pair[0] != pair[1]]
+        return len(changed) == 1 and set(changed[0]) <= FUZZY_VOWELS
+    shorter, longer = sorted((word, other), key=len)
+    if len(longer) - len(shorter) != 1:
+        return False
+    return any(longer[:i] + longer[i + 1 :] == shorter for i in range(len(longer)))
+
+
+def _fuzzy_blocks(tokens):
+    """
+    Blocking keys for a tokenized name: for every word long enough to be fuzzy
+    matched, the name with that word replaced by its first three letters.
+    """
+    for i, token in enumerate(tokens):
+        if token.isalpha() and len(token) >= FUZZY_MIN_LENGTH:
+            yield (i, token[:3], tuple(tokens[:i]), tuple(tokens[i + 1 :])), token
+
+
+def build_drug_name_map(drugs_df, cached_map):
+    """
+    Map raw medicinalproduct names that are not in cached_map to canonical drug
+    names, using openfda.generic_name where present, then the normalized name
+    key, then blocked fuzzy matching against more frequently reported drugs.
+    """
+    raw_names = drugs_df["medicinalproduct"].dropna()
+    new_names = pd.Index(raw_names.unique()).difference(cached_map.index)
+    if new_names.empty:
+        return cached_map.iloc[0:0]
+
+    keys = pd.Series([drug_name_key(name) for name in new_names], index=new_names)
+    canonical = keys.copy()
+    method = pd.Series("normalized_key", index=new_names)
+
+    generic = drugs_df.loc[
+        drugs_df["medicinalproduct"].isin(new_names),
+        ["medicinalproduct", "openfda.generic_name"],
+    ].dropna()
+    if not generic.empty:
+        generic_names = generic["openfda.generic_name"].unique()
+        generic_keys = dict(zip(generic_names, map(drug_name_key, generic_names)))
+        generic["key"] = generic["openfda.generic_name"].map(generic_keys)
+        generic_mode = (
+            generic.groupby(["medicinalproduct", "key"]).size()
+            .sort_values(ascending=False)
+            .reset_index()
+            .drop_duplicates("medicinalproduct")
+            .set_index("medicinalproduct")["key"]
+        )
+        canonical[generic_mode.index] = generic_mode
+        method[generic_mode.index] = "generic_name"
+
+    all_canonical = pd.concat([cached_map["canonical_name"], canonical])
+    all_method = pd.concat([cached_map["method"], method])
+    frequency = raw_names.map(all_canonical).value_counts()
+    trusted = set(all_canonical[all_method == "generic_name"])
+
+    blocks = {}
+    for name, count in frequency.items():
+        for block, token in _fuzzy_blocks(name.split()):
+            blocks.setdefault(block, []).append((token, name, count))
+
+    merged = {}
+    candidates = set(canonical[method == "normalized_key"]) - trusted
+    for name in sorted(candidates, key=lambda n: -frequency.get(n, 0)):
+        min_count = FUZZY_MIN_FREQUENCY_RATIO * frequency.get(name, 0)
+        matches = [
+            (-count, target)
+            for block, token in _fuzzy_blocks(name.split())
+            for target_token, target, count in blocks.get(block, [])
+            if count >= min_count
+            and target != name
+            and _is_misspelling(token, target_token)
+        ]
+        if matches:
+            target = min(matches)[1]
+            merged[name] = merged.get(target, target)
+
+    fuzzy = canonical.isin(merged.keys()) & (method == "normalized_key")
+    canonical[fuzzy] = canonical[fuzzy].map(merged)
+    method[fuzzy] = "fuzzy"
+
+    return pd.DataFrame({"canonical_name": canonical, "method": method})
+
+
+def canonicalize_drug_names(drugs_df, conn):
+    """
+    Replace medicinalproduct with its canonical name (keeping the original in
+    medicinalproduct_raw), extending the cached DRUG_NAME_MAP table as needed.
+    """
+    has_cache = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'DRUG_NAME_MAP'"
+    ).fetchone()
+    if has_cache:
+        cached_map = pd.read_sql_query(
+            "SELECT raw_name, canonical_name, method FROM DRUG_NAME_MAP", conn
+        ).set_index("raw_name")
+    else:
+        cached_map = pd.DataFrame(
+            {"canonical_name": pd.Series(dtype=str), "method": pd.Series(dtype=str)}
+        )
+
+    new_map = build_drug_name_map(drugs_df, cached_map)
+    if not new_map.empty:
+        new_map.rename_axis("raw_name").reset_index().to_sql(
+            "DRUG_NAME_MAP", conn, if_exists="append", index=False
+        )
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_drug_name_map_raw "
+            "ON DRUG_NAME_MAP (raw_name)"
+        )
+        conn.commit()
+    name_map = pd.concat([cached_map, new_map])["canonical_name"]
+
+    drugs_df["medicinalproduct_raw"] = drugs_df["medicinalproduct"]
+    drugs_df["medicinalproduct"] = drugs_df["medicinalproduct_raw"].map(name_map)
+
+    raw_count = drugs_df["medicinalproduct_raw"].nunique()
+    canonical_count = drugs_df["medicinalproduct"].nunique()
+    print(
+        f"Canonicalized {raw_count} raw drug names into {canonical_count} drugs "
+        f"({len(new_map)} new name mappings)."
+    )
+    return drugs_df
+
+
+def collapse_drug_rows(drugs_df):
+    """
+    Merge the rows of a report that name the same canonical drug (brand and
+    generic names, several strengths, one row per openfda generic name) into
+    one row running from the earliest start to the latest end date. A missing
+    date counts as open-ended, as in the graph build. Other columns keep their
+    first non-null value.
+    """
+    keys = ["safetyreportid", "medicinalproduct"]
+    start = drugs_df["drugstartdate"].fillna(pd.Timestamp.min)
+    end = drugs_df["drugenddate"].fillna(pd.Timestamp.max)
+    aggregations = {col: "first" for col in drugs_df.columns if col not in keys}
+    aggregations.update({"drugstartdate": "min", "drugenddate": "max"})
+
+    collapsed = (
+        drugs_df.assign(drugstartdate=start, drugenddate=end)
+        .groupby(keys, sort=False, dropna=False)
+        .agg(aggregations)
+        .reset_index()[drugs_df.columns]
+    )
+    collapsed["drugstartdate"] = collapsed["drugstartdate"].mask(
+        collapsed["drugstartdate"] == pd.Timestamp.min
+    )
+    collapsed["drugenddate"] = collapsed["drugenddate"].mask(
+        collapsed["drugenddate"] == pd.Timestamp.max
+    )
+
+    print(
+        f"Collapsed {len(drugs_df) - len(collapsed)} drug rows repeating a "
+        "canonical drug within a report."
+    )
+    return collapsed
+
+
+def encode_column(values):
+    """
+    Factorize text values into integer IDs (nullable) and a dictionary table.
+    IDs follow sorted name order, so comparing IDs orders names the same way.
+    """
+    codes, names = pd.factorize(values, sort=True)
+    ids = pd.array(codes, dtype="Int32")
+    ids[codes < 0] = pd.NA
+    return ids, names
+
+
+def encode_dictionaries(reactions_df, drugs_df, metadata_df, conn):
+    """
+    Replace free-text drug, raw drug name, generic name, reaction and indication
+    columns with integer IDs and write the matching *_DICT lookup tables. Coded
+    FAERS fields (patient sex, seriousness flags) are stored as small integers.
+    """
+    drug_ids, drug_names = encode_column(drugs_df["medicinalproduct"])
+    drugs_df = drugs_df.drop(columns=["medicinalproduct"])
+    drugs_df.insert(1, "drug_id", drug_ids)
+
+    raw_drug_ids, raw_drug_names = encode_column(drugs_df["medicinalproduct_raw"])
+    drugs_df["medicinalproduct_raw"] = raw_drug_ids
+    generic_name_ids, generic_names = encode_column(drugs_df["openfda.generic_name"])
+    drugs_df["openfda.generic_name"] = generic_name_ids
+    drugs_df = drugs_df.rename(
+        columns={
+            "medicinalproduct_raw": "raw_drug_id",
+            "openfda.generic_name": "generic_name_id",
+        }
+    )
+
+    reaction_ids, reaction_names = encode_column(reactions_df["reactionmeddrapt"])
+    reactions_df = reactions_df.drop(columns=["reactionmeddrapt"])
+    reactions_df["reaction_id"] = reaction_ids
+
+    indication_ids, indication_names = encode_column(
+        pd.concat([drugs_df["drugindication"], metadata_df["drugindication"]])
+    )
+    drugs_df["drugindication"] = indication_ids[: len(drugs_df)]
+    metadata_df["drugindication"] = indication_ids[len(drugs_df) :]
+    drugs_df = drugs_df.rename(columns={"drugindication": "indication_id"})
+    metadata_df = metadata_df.rename(columns={"drugindication": "indication_id"})
+
+    for col in [
+        "patientsex",
+        "seriousnesshospitalization",
+        "seriousnessdisabling",
+        "seriousnessdeath",
+        "seriousnesslifethreatening",
+    ]:
+        metadata_df[col] = pd.to_numeric(metadata_df[col], errors="coerce").astype(
+            "Int8"
+        )
+
+    for table, id_column, name_column, names in [
+        ("DRUG_DICT", "drug_id", "drug", drug_names),
+        ("REACTION_DICT", "reaction_id", "reaction", reaction_names),
+        ("INDICATION_DICT", "indication_id", "indication", indication_names),
+        ("RAW_DRUG_DICT", "raw_drug_id", "raw_name", raw_drug_names),
+        ("GENERIC_NAME_DICT", "generic_name_id", "generic_name", generic_names),
+    ]:
+        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+        conn.execute(
+            f'CREATE TABLE "{table}" '
+            f'("{id_column}" INTEGER PRIMARY KEY, "{name_column}" TEXT)'
+        )
+        conn.executemany(
+            f'INSERT INTO "{table}" VALUES (?, ?)', enumerate(names.tolist())
+        )
+    conn.commit()
+
+    print(
+        f"Encoded {len(drug_names)} drugs, {len(reaction_names)} reactions and "
+        f"{len(indication_names)} indications."
+    )
+    return reactions_df, drugs_df, metadata_df
+
+
+def create_event_view(conn):
+    """
+    Create vwEventDrugReaction: one row per report, drug and reaction, with the
+    drug, reaction and indication as their integer IDs (decoded by the *_DICT
+    tables) and the report severity from the seriousness flags, using the same
+    levels as SERIOUSNESS_LEVELS in graph-preprocessing.py.
+    """
+    conn.execute("DROP VIEW IF EXISTS vwEventDrugReaction")
+    conn.execute(
+        """
+        CREATE VIEW vwEventDrugReaction AS
+        SELECT
+            d.safetyreportid,
+            d.drug_id,
+            r.reaction_id,
+            d.indication_id,
+            m.patientsex,
+            CASE
+                WHEN m.seriousnessdeath = 1 THEN 3
+                WHEN m.seriousnesslifethreatening = 1 THEN 2
+                WHEN m.seriousnesshospitalization = 1
+                    OR m.seriousnessdisabling = 1 THEN 1
+                ELSE 0
+            END AS severity,
+            m.patientage AS patientonsetage,
+            m.receiptdate
+        FROM DRUGS d
+        JOIN REACTIONS r ON r.safetyreportid = d.safetyreportid
+        LEFT JOIN METADATA m ON m.safetyreportid = d.safetyreportid
+        WHERE d.drug_id IS NOT NULL
+        """
+    )
+    conn.commit()
+
+
 input_data_dir = os.path.join(".", "target")
 
 needed_drug_columns = [
@@ -188,18 +565,30 @@ def main(max_files):
         # Connect to SQLite
         conn = sqlite3.connect("data/fda_data.db")
 
+        # Canonicalize drug names
+        drugs_df = canonicalize_drug_names(drugs_df, conn)
+        drugs_df = collapse_drug_rows(drugs_df)
+
+        # Dictionary-encode text columns
+        reactions_df, drugs_df, metadata_df = encode_dictionaries(
+            reactions_df, drugs_df, metadata_df, conn
+        )
+
         # Write Reactions
-        reactions_df.to_sql("REACTIONS", conn, if_exists="append", index=False)
+        reactions_df.to_sql("REACTIONS", conn, if_exists="replace", index=False)
         print("Reactions data written to REACTIONS table.")
 
         # Write Drugs
-        drugs_df.to_sql("DRUGS", conn, if_exists="append", index=False)
+        drugs_df.to_sql("DRUGS", conn, if_exists="replace", index=False)
         print("Drugs data written to DRUGS table.")
 
         # Write Metadata
-        metadata_df.to_sql("METADATA", conn, if_exists="append", index=False)
+        metadata_df.to_sql("METADATA", conn, if_exists="replace", index=False)
         print("Metadata written to METADATA table.")
 
+        create_event_view(conn)
+        print("Event view written to vwEventDrugReaction.")
+
         conn.close()
         print("Database connection closed.")
     else:
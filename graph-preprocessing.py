@@ -1,33 +1,189 @@
+import argparse
 import sqlite3
 import pandas as pd
 import numpy as np
+import networkx as nx
 import os
+import threading
+from scipy import sparse
+
+# Report severity is the highest level among the FAERS seriousness flags set on
+# the report (0 when none are set).
+SERIOUSNESS_LEVELS = {
+    "seriousnesshospitalization": 1,
+    "seriousnessdisabling": 1,
+    "seriousnesslifethreatening": 2,
+    "seriousnessdeath": 3,
+}
+
+# (pair, reaction) combinations reported fewer times than this are not stored.
+MIN_PAIR_REACTION_COUNT = 2
+
+# Number of drug pairs multiplied against the report x reaction matrix at once.
+PAIR_BLOCK_SIZE = 200_000
+
+# Most reported reactions kept per drug pair in DDI_PAIR_TOP_REACTIONS.
+TOP_PAIR_REACTIONS = 5
+
+# Edge counts are also bucketed by report receipt date at this pandas period
+# frequency ("Q" = calendar quarter) for DDI_GRAPH_PERIODS.
+PERIOD_FREQ = "Q"
+
+# Approximate (--approximate) builds keep edge counts in a count-min sketch of
+# SKETCH_DEPTH rows x 2**SKETCH_WIDTH_BITS counters (plus a second sketch for
+# severity sums) and track at most SKETCH_HEAVY_HITTERS candidate edges, so
+# memory is fixed by these settings rather than by the number of distinct pairs.
+# Only edges with an estimated weight of at least SKETCH_MIN_WEIGHT are written.
+# These are defaults; the --sketch_* options override them.
+SKETCH_WIDTH_BITS = 20
+SKETCH_DEPTH = 4
+SKETCH_HEAVY_HITTERS = 100_000
+SKETCH_MIN_WEIGHT = 5
+SKETCH_CHUNK_ROWS = 200_000
+
+# Weighted PageRank for DDI_NODES; power iteration stops once the L1 change
+# falls below n_nodes * PAGERANK_TOLERANCE.
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-10
+PAGERANK_MAX_ITER = 100
+
+# DDI_GRAPH_BACKBONE keeps the edges that pass the disparity filter at this
+# significance level for at least one of their endpoints.
+BACKBONE_ALPHA = 0.05
+
+# setup_dataset.py runs stages that write different tables of ddi-graph.db side
+# by side. SQLite allows one writer per database, so writes to it take
+# GRAPH_DB_WRITE_LOCK, and connections wait up to GRAPH_DB_TIMEOUT seconds for
+# another stage's write to commit instead of failing with "database is locked".
+GRAPH_DB_WRITE_LOCK = threading.Lock()
+GRAPH_DB_TIMEOUT = 600
+
+
+def connect_graph_db(graph_db_path):
+    return sqlite3.connect(graph_db_path, timeout=GRAPH_DB_TIMEOUT)
+
+
+def load_report_severity(conn):
+    columns = ", ".join(SERIOUSNESS_LEVELS)
+    metadata_df = pd.read_sql_query(
+        f"SELECT safetyreportid, {columns} FROM METADATA", conn
+    )
+
+    severity = np.zeros(len(metadata_df), dtype=np.int8)
+    for column, level in SERIOUSNESS_LEVELS.items():
+        flagged = pd.to_numeric(metadata_df[column], errors="coerce").eq(1).values
+        severity = np.where(flagged, np.maximum(severity, level), severity)
+
+    return (
+        pd.Series(severity, index=metadata_df["safetyreportid"].astype(str))
+        .groupby(level=0)
+        .max()
+    )
+
+
+def load_report_periods(conn, freq=PERIOD_FREQ):
+    """
+    Period ordinal (pandas Period.ordinal at freq) of each report's receiptdate.
+    Reports without a usable receiptdate are left out.
+    """
+    metadata_df = pd.read_sql_query(
+        "SELECT safetyreportid, receiptdate FROM METADATA", conn
+    )
+    receipt = pd.to_datetime(metadata_df["receiptdate"], errors="coerce")
+    known = receipt.notna().values
+    periods = pd.Series(
+        receipt[known].dt.to_period(freq).array.asi8,
+        index=metadata_df["safetyreportid"][known].astype(str),
+    )
+    return periods[~periods.index.duplicated()]
+
+
+def write_edge_periods(edge_period_counts, graph_conn, freq=PERIOD_FREQ):
+    """
+    Write per-period edge counts to DDI_GRAPH_PERIODS with a running total per
+    edge (cum_weight), so the weight of an edge over any range of periods is
+    the difference of two cum_weight lookups. DDI_PERIODS lists every period
+    between the first and last one seen.
+    """
+    periods_df = pd.DataFrame(
+        [
+            (drug_a, drug_b, period, count)
+            for (drug_a, drug_b, period), count in edge_period_counts.items()
+        ],
+        columns=["drug_a", "drug_b", "period", "weight"],
+    ).sort_values(["drug_a", "drug_b", "period"], ignore_index=True)
+    periods_df["cum_weight"] = periods_df.groupby(["drug_a", "drug_b"])[
+        "weight"
+    ].cumsum()
+    periods_df.to_sql("DDI_GRAPH_PERIODS", graph_conn, if_exists="replace", index=False)
+    graph_conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ddi_graph_periods_edge "
+        "ON DDI_GRAPH_PERIODS (drug_a, drug_b, period)"
+    )
+
+    if periods_df.empty:
+        period_range = pd.PeriodIndex([], freq=freq)
+    else:
+        period_range = pd.period_range(
+            pd.Period(ordinal=int(periods_df["period"].min()), freq=freq),
+            pd.Period(ordinal=int(periods_df["period"].max()), freq=freq),
+        )
+    pd.DataFrame(
+        {
+            "period": period_range.asi8,
+            "label": period_range.astype(str),
+            "start_date": period_range.start_time.strftime("%Y-%m-%d"),
+            "end_date": period_range.end_time.strftime("%Y-%m-%d"),
+        }
+    ).to_sql("DDI_PERIODS", graph_conn, if_exists="replace", index=False)
+    graph_conn.commit()
+
+
+def copy_dictionary(table, conn, graph_conn):
+    """
+    Copy a dictionary table (integer ID -> name) from the normalized database so
+    the graph tables can be decoded on their own.
+    """
+    pd.read_sql_query(f'SELECT * FROM "{table}"', conn).to_sql(
+        table, graph_conn, if_exists="replace", index=False
+    )
+
+
+def copy_drug_aliases(conn, graph_conn):
+    """
+    Copy the raw drug names seen during normalization (DRUG_NAME_MAP) into
+    DRUG_ALIASES (raw_name -> drug_id), so lookups by raw name resolve to
+    graph nodes.
+    """
+    pd.read_sql_query(
+        "SELECT m.raw_name, d.drug_id FROM DRUG_NAME_MAP m "
+        "JOIN DRUG_DICT d ON d.drug = m.canonical_name",
+        conn,
+    ).to_sql("DRUG_ALIASES", graph_conn, if_exists="replace", index=False)
 
 
 def build_ddi_graph(db_path):
     conn = sqlite3.connect(db_path)
-    conn_2 = sqlite3.connect("data/prj174.db")
-    graph_conn = sqlite3.connect("data/ddi-graph.db")
+    graph_conn = connect_graph_db("data/ddi-graph.db")
 
     drugs_df = pd.read_sql_query(
-        "SELECT safetyreportid, medicinalproduct, drugstartdate, drugenddate FROM DRUGS",
+        "SELECT safetyreportid, drug_id, drugstartdate, drugenddate FROM DRUGS "
+        "WHERE drug_id IS NOT NULL",
         conn,
     )
-    reactions_df = pd.read_sql_query(
-        "SELECT * FROM vwEventDrugReaction",
-        conn_2,
-    )
-    reactions_df["safetyreportid"] = reactions_df["safetyreportid"].astype(str)
-
     drugs_df["drugstartdate"] = pd.to_datetime(
         drugs_df["drugstartdate"], errors="coerce"
     )
     drugs_df["drugenddate"] = pd.to_datetime(drugs_df["drugenddate"], errors="coerce")
 
-    drugs_df["drugstartdate"].fillna(pd.Timestamp.min, inplace=True)
-    drugs_df["drugenddate"].fillna(pd.Timestamp.max, inplace=True)
+    drugs_df["drugstartdate"] = drugs_df["drugstartdate"].fillna(pd.Timestamp.min)
+    drugs_df["drugenddate"] = drugs_df["drugenddate"].fillna(pd.Timestamp.max)
+
+    severity = load_report_severity(conn)
+    periods = load_report_periods(conn)
 
     edge_dict = {}
+    edge_period_counts = {}
     grouped = drugs_df.groupby("safetyreportid")
     for safetyreportid, group in grouped:
         group = group.copy()
@@ -35,12 +191,10 @@ def build_ddi_graph(db_path):
 
             start_dates = group["drugstartdate"].values
             end_dates = group["drugenddate"].values
-            drugs = group["medicinalproduct"].values
-
-            report_severity = pd.NA # disregard severity for now
+            drugs = group["drug_id"].values
 
-            if pd.isna(report_severity):
-                report_severity = 0
+            report_severity = int(severity.get(str(safetyreportid), 0))
+            report_period = periods.get(str(safetyreportid))
 
             overlap_matrix = (start_dates[:, None] <= end_dates) & (
                 end_dates[:, None] >= start_dates
@@ -55,6 +209,8 @@ def build_ddi_graph(db_path):
                 drug_a = drugs[i]
                 drug_b = drugs[j]
 
+                if drug_a == drug_b:
+                    continue
                 if drug_a > drug_b:
                     drug_a, drug_b = drug_b, drug_a
 
@@ -65,6 +221,12 @@ def build_ddi_graph(db_path):
                 edge_dict[edge_key]["count"] += 1
                 edge_dict[edge_key]["severity_sum"] += report_severity
 
+                if report_period is not None:
+                    period_key = (drug_a, drug_b, report_period)
+                    edge_period_counts[period_key] = (
+                        edge_period_counts.get(period_key, 0) + 1
+                    )
+
     edges_list = []
     for (drug_a, drug_b), data in edge_dict.items():
         edges_list.append(
@@ -78,33 +240,636 @@ def build_ddi_graph(db_path):
 
     edges_df = pd.DataFrame(edges_list)
 
-    node_severity = {}
-    for _, row in edges_df.iterrows():
+    with GRAPH_DB_WRITE_LOCK:
+        edges_df.to_sql("DDI_GRAPH", graph_conn, if_exists="replace", index=False)
+        graph_conn.execute("DROP TABLE IF EXISTS DDI_GRAPH_SKETCH")
+        write_edge_periods(edge_period_counts, graph_conn)
+        copy_dictionary("DRUG_DICT", conn, graph_conn)
+        copy_drug_aliases(conn, graph_conn)
+        graph_conn.commit()
+
+    conn.close()
+    graph_conn.close()
+
+    return edges_df
+
+
+def iter_report_chunks(conn, chunk_rows):
+    """
+    Stream DRUGS rows ordered by report, with each report's severity attached,
+    in chunks of about chunk_rows rows that never split a report.
+    """
+    levels = sorted(SERIOUSNESS_LEVELS.items(), key=lambda item: -item[1])
+    cases = " ".join(
+        f"WHEN CAST({column} AS INTEGER) = 1 THEN {level}" for column, level in levels
+    )
+    query = (
+        "SELECT d.safetyreportid, d.drug_id, d.drugstartdate, d.drugenddate, "
+        "COALESCE(s.severity, 0) AS severity FROM DRUGS d LEFT JOIN ("
+        f"  SELECT safetyreportid, MAX(CASE {cases} ELSE 0 END) AS severity"
+        "  FROM METADATA GROUP BY safetyreportid"
+        ") s ON s.safetyreportid = d.safetyreportid "
+        "WHERE d.drug_id IS NOT NULL ORDER BY d.safetyreportid"
+    )
+
+    carry = None
+    for chunk in pd.read_sql_query(query, conn, chunksize=chunk_rows):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        # the last report may continue in the next chunk
+        tail = chunk["safetyreportid"].values == chunk["safetyreportid"].iloc[-1]
+        carry = chunk[tail]
+        if not tail.all():
+            yield chunk[~tail]
+    if carry is not None:
+        yield carry
+
+
+def overlapping_pairs(chunk, n_drugs):
+    """
+    Edge keys (drug_a * n_drugs + drug_b, drug_a < drug_b) and report severity
+    for every pair of drugs in the same report whose date ranges overlap, one
+    entry per pair of rows (build_ddi_graph counts each of these twice).
+    """
+    start_dates = (
+        pd.to_datetime(chunk["drugstartdate"], errors="coerce")
+        .fillna(pd.Timestamp.min)
+        .values
+    )
+    end_dates = (
+        pd.to_datetime(chunk["drugenddate"], errors="coerce")
+        .fillna(pd.Timestamp.max)
+        .values
+    )
+    drugs = chunk["drug_id"].values.astype(np.int64)
+    # report x row incidence, so pairs of rows come from the same triangle
+    # gather as the drug pairs in report_pair_entries
+    reports = pd.factorize(chunk["safetyreportid"])[0]
+    report_rows = sparse.csr_matrix(
+        (np.ones(len(chunk), dtype=np.int8), (reports, np.arange(len(chunk)))),
+        shape=(reports.max() + 1, len(chunk)),
+    )
+    pairs_i, pairs_j = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for _, i, j in report_pair_entries(report_rows):
+        keep = (
+            (start_dates[i] <= end_dates[j])
+            & (end_dates[i] >= start_dates[j])
+            & (drugs[i] != drugs[j])
+        )
+        pairs_i.append(i[keep])
+        pairs_j.append(j[keep])
+    i, j = np.concatenate(pairs_i), np.concatenate(pairs_j)
+    drug_a = np.minimum(drugs[i], drugs[j])
+    drug_b = np.maximum(drugs[i], drugs[j])
+    return drug_a * n_drugs + drug_b, chunk["severity"].values[i].astype(np.int64)
+
+
+def sketch_columns(keys, multipliers, width_bits):
+    """Multiply-shift hash of each key into one counter column per sketch row."""
+    hashed = keys.astype(np.uint64)[None, :] * multipliers[:, None]
+    return (hashed >> np.uint64(64 - width_bits)).astype(np.intp)
+
+
+def sketch_query(sketch, columns):
+    return sketch[np.arange(sketch.shape[0])[:, None], columns].min(axis=0)
+
+
+def build_ddi_graph_approx(
+    db_path,
+    width_bits=SKETCH_WIDTH_BITS,
+    depth=SKETCH_DEPTH,
+    heavy_hitters=SKETCH_HEAVY_HITTERS,
+    min_weight=SKETCH_MIN_WEIGHT,
+    chunk_rows=SKETCH_CHUNK_ROWS,
+    seed=0,
+):
+    """
+    Approximate DDI_GRAPH for exploratory builds. Edge weights and severity sums
+    are kept in count-min sketches and only the heavy_hitters edges with the
+    largest estimates are tracked, so memory does not grow with the number of
+    distinct pairs. Estimates never undercount. The bound recorded in
+    DDI_GRAPH_SKETCH holds for each edge separately, not for all edges at
+    once: any single edge's weight is overcounted by at most epsilon *
+    total_weight (overcount_bound) with probability at least 1 - delta.
+    Per-period counts are not kept in this mode.
+    """
+    conn = sqlite3.connect(db_path)
+    graph_conn = connect_graph_db("data/ddi-graph.db")
+    n_drugs = conn.execute("SELECT COUNT(*) FROM DRUG_DICT").fetchone()[0]
+
+    width = 1 << width_bits
+    multipliers = np.random.default_rng(seed).integers(
+        0, np.iinfo(np.uint64).max, size=depth, dtype=np.uint64, endpoint=True
+    ) | np.uint64(1)
+    weight_sketch = np.zeros((depth, width), dtype=np.int64)
+    severity_sketch = np.zeros((depth, width), dtype=np.int64)
+    candidates = np.empty(0, dtype=np.int64)
+    total_weight = 0
+
+    for chunk in iter_report_chunks(conn, chunk_rows):
+        keys, severities = overlapping_pairs(chunk, n_drugs)
+        if len(keys) == 0:
+            continue
+
+        chunk_keys, inverse = np.unique(keys, return_inverse=True)
+        chunk_weights = 2 * np.bincount(inverse, minlength=len(chunk_keys))
+        chunk_severity = 2 * np.bincount(
+            inverse, weights=severities, minlength=len(chunk_keys)
+        ).astype(np.int64)
+        total_weight += int(chunk_weights.sum())
+
+        columns = sketch_columns(chunk_keys, multipliers, width_bits)
+        for row in range(depth):
+            np.add.at(weight_sketch[row], columns[row], chunk_weights)
+            np.add.at(severity_sketch[row], columns[row], chunk_severity)
 
-        if row["drug_a"] not in node_severity:
-            node_severity[row["drug_a"]] = {"severity_sum": 0, "count": 0}
-        node_severity[row["drug_a"]]["severity_sum"] += row["mean_severity"]
-        node_severity[row["drug_a"]]["count"] += 1
+        # keep the heavy_hitters candidates with the largest estimates so far
+        candidates = np.union1d(candidates, chunk_keys)
+        if len(candidates) > heavy_hitters:
+            estimates = sketch_query(
+                weight_sketch, sketch_columns(candidates, multipliers, width_bits)
+            )
+            top = np.argpartition(-estimates, heavy_hitters - 1)[:heavy_hitters]
+            candidates = np.sort(candidates[top])
 
-        if row["drug_b"] not in node_severity:
-            node_severity[row["drug_b"]] = {"severity_sum": 0, "count": 0}
-        node_severity[row["drug_b"]]["severity_sum"] += row["mean_severity"]
-        node_severity[row["drug_b"]]["count"] += 1
+    columns = sketch_columns(candidates, multipliers, width_bits)
+    weights = sketch_query(weight_sketch, columns)
+    severity_sums = sketch_query(severity_sketch, columns)
+    keep = weights >= min_weight
+    candidates, weights, severity_sums = (
+        candidates[keep],
+        weights[keep],
+        severity_sums[keep],
+    )
 
-    nodes_list = [
-        {"drug": drug, "mean_severity": data["severity_sum"] / data["count"]}
-        for drug, data in node_severity.items()
-    ]
-    nodes_df = pd.DataFrame(nodes_list)
+    edges_df = pd.DataFrame(
+        {
+            "drug_a": candidates // max(n_drugs, 1),
+            "drug_b": candidates % max(n_drugs, 1),
+            "weight": weights,
+            # both sums are overestimates, so clip to the highest severity level
+            "mean_severity": np.minimum(
+                severity_sums / weights, max(SERIOUSNESS_LEVELS.values())
+            ),
+        }
+    )
+
+    epsilon = np.e / width
+    sketch_df = pd.DataFrame(
+        [
+            {
+                "width": width,
+                "depth": depth,
+                "heavy_hitters": heavy_hitters,
+                "min_weight": min_weight,
+                "total_weight": total_weight,
+                "epsilon": epsilon,
+                "delta": np.exp(-depth),
+                "overcount_bound": int(np.ceil(epsilon * total_weight)),
+                "edges_written": len(edges_df),
+            }
+        ]
+    )
 
-    edges_df.to_sql("DDI_GRAPH", graph_conn, if_exists="replace", index=False)
-    nodes_df.to_sql("DDI_NODES", graph_conn, if_exists="replace", index=False)
+    with GRAPH_DB_WRITE_LOCK:
+        edges_df.to_sql("DDI_GRAPH", graph_conn, if_exists="replace", index=False)
+        sketch_df.to_sql(
+            "DDI_GRAPH_SKETCH", graph_conn, if_exists="replace", index=False
+        )
+        # per-period counts and pair tables from an earlier exact build would
+        # no longer match
+        for table in [
+            "DDI_GRAPH_PERIODS",
+            "DDI_PERIODS",
+            "DDI_PAIRS",
+            "DDI_PAIR_REACTIONS",
+            "DDI_PAIR_TOP_REACTIONS",
+        ]:
+            graph_conn.execute(f"DROP TABLE IF EXISTS {table}")
+        copy_dictionary("DRUG_DICT", conn, graph_conn)
+        copy_drug_aliases(conn, graph_conn)
+        graph_conn.commit()
 
     conn.close()
     graph_conn.close()
 
-    return edges_df, nodes_df, reactions_df
+    print(
+        f"Approximate graph: {len(edges_df)} edges with weight >= {min_weight}, "
+        f"each overcounted by at most {sketch_df['overcount_bound'][0]} "
+        f"with probability {1 - sketch_df['delta'][0]:.3f}."
+    )
+    return edges_df, sketch_df
+
+
+def weighted_pagerank(
+    adjacency,
+    damping=PAGERANK_DAMPING,
+    tolerance=PAGERANK_TOLERANCE,
+    max_iter=PAGERANK_MAX_ITER,
+):
+    """
+    PageRank by power iteration over a symmetric weighted adjacency matrix.
+    Rank held by nodes without edges is spread evenly over all nodes.
+    """
+    n = adjacency.shape[0]
+    strength = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = strength == 0
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        spread = np.divide(rank, strength, out=np.zeros(n), where=~dangling)
+        new_rank = (
+            damping * (adjacency @ spread + rank[dangling].sum() / n)
+            + (1 - damping) / n
+        )
+        converged = np.abs(new_rank - rank).sum() < n * tolerance
+        rank = new_rank
+        if converged:
+            break
+    return rank / rank.sum()
+
+
+def louvain_labels(adjacency, seed=0):
+    """
+    Louvain community label per node of a symmetric weighted adjacency matrix,
+    numbered by community size, largest first.
+    """
+    graph = nx.from_scipy_sparse_array(adjacency)
+    communities = nx.community.louvain_communities(graph, weight="weight", seed=seed)
+    labels = np.empty(adjacency.shape[0], dtype=np.int64)
+    for label, members in enumerate(sorted(communities, key=len, reverse=True)):
+        labels[list(members)] = label
+    return labels
+
+
+def build_node_table(graph_db_path):
+    """
+    Write DDI_NODES: per drug, the mean severity of its edges, its degree and
+    weighted degree, weighted PageRank and a community label, so the app can
+    size, color and rank nodes without running graph algorithms per request.
+    """
+    graph_conn = connect_graph_db(graph_db_path)
+    edges_df = pd.read_sql_query(
+        "SELECT drug_a, drug_b, weight, mean_severity FROM DDI_GRAPH", graph_conn
+    )
+
+    # each edge contributes its mean severity to both endpoints
+    endpoints = pd.concat(
+        [
+            edges_df[["drug_a", "mean_severity"]].rename(columns={"drug_a": "drug"}),
+            edges_df[["drug_b", "mean_severity"]].rename(columns={"drug_b": "drug"}),
+        ],
+        ignore_index=True,
+    )
+    nodes_df = (
+        endpoints.groupby("drug", sort=True)["mean_severity"].mean().reset_index()
+    )
+
+    # symmetric weighted adjacency over the nodes, without self loops
+    node_a = np.searchsorted(nodes_df["drug"].values, edges_df["drug_a"].values)
+    node_b = np.searchsorted(nodes_df["drug"].values, edges_df["drug_b"].values)
+    links = node_a != node_b
+    node_a, node_b = node_a[links], node_b[links]
+    weights = edges_df["weight"].values[links].astype(np.float64)
+    n_nodes = len(nodes_df)
+    adjacency = sparse.csr_matrix(
+        (
+            np.concatenate([weights, weights]),
+            (np.concatenate([node_a, node_b]), np.concatenate([node_b, node_a])),
+        ),
+        shape=(n_nodes, n_nodes),
+    )
+
+    nodes_df["degree"] = np.diff(adjacency.indptr)
+    nodes_df["weighted_degree"] = np.asarray(adjacency.sum(axis=1)).ravel()
+    nodes_df["pagerank"] = weighted_pagerank(adjacency) if n_nodes else []
+    nodes_df["community"] = louvain_labels(adjacency) if n_nodes else []
+
+    with GRAPH_DB_WRITE_LOCK:
+        nodes_df.to_sql("DDI_NODES", graph_conn, if_exists="replace", index=False)
+        graph_conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_ddi_nodes_drug ON DDI_NODES (drug)"
+        )
+        graph_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ddi_nodes_pagerank "
+            "ON DDI_NODES (pagerank)"
+        )
+        graph_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ddi_nodes_community "
+            "ON DDI_NODES (community, pagerank)"
+        )
+        graph_conn.commit()
+    graph_conn.close()
+
+    return nodes_df
+
+
+def build_backbone(graph_db_path, alpha=BACKBONE_ALPHA):
+    """
+    Write DDI_GRAPH_BACKBONE, the serving subset of DDI_GRAPH: edges that pass
+    the disparity filter (Serrano et al., 2009) at significance alpha for at
+    least one endpoint, plus the heaviest edge of every drug so that no drug
+    drops out of the network view. Self loops (found in graphs built before
+    repeated drugs were collapsed) are only kept for drugs with no other edge,
+    with a NULL alpha.
+    """
+    graph_conn = connect_graph_db(graph_db_path)
+    edges_df = pd.read_sql_query(
+        "SELECT drug_a, drug_b, weight, mean_severity FROM DDI_GRAPH", graph_conn
+    )
+    n_total = len(edges_df)
+    loops = (edges_df["drug_a"] == edges_df["drug_b"]).values
+    linked = pd.unique(edges_df.loc[~loops, ["drug_a", "drug_b"]].values.ravel("K"))
+    lone_loops_df = edges_df[loops & ~edges_df["drug_a"].isin(linked).values]
+    edges_df = edges_df[~loops].reset_index(drop=True)
+
+    n_edges = len(edges_df)
+    codes, nodes = pd.factorize(pd.concat([edges_df["drug_a"], edges_df["drug_b"]]))
+    node_a, node_b = codes[:n_edges], codes[n_edges:]
+    weights = edges_df["weight"].values.astype(np.float64)
+    strength = np.bincount(node_a, weights, len(nodes)) + np.bincount(
+        node_b, weights, len(nodes)
+    )
+    degree = np.bincount(node_a, minlength=len(nodes)) + np.bincount(
+        node_b, minlength=len(nodes)
+    )
+
+    def endpoint_alpha(node):
+        # chance that a node's strength, split uniformly at random over its
+        # edges, gives this edge at least its observed share
+        share = weights / strength[node]
+        return np.where(degree[node] > 1, (1 - share) ** (degree[node] - 1), 1.0)
+
+    edges_df["alpha"] = np.minimum(endpoint_alpha(node_a), endpoint_alpha(node_b))
+    keep = edges_df["alpha"].values < alpha
+
+    endpoints = pd.DataFrame(
+        {
+            "node": np.concatenate([node_a, node_b]),
+            "edge": np.tile(np.arange(n_edges), 2),
+            "weight": np.concatenate([weights, weights]),
+        }
+    )
+    heaviest = endpoints.sort_values(
+        ["node", "weight"], ascending=[True, False], kind="stable"
+    ).drop_duplicates("node")["edge"]
+    keep[heaviest.values] = True
+
+    backbone_df = pd.concat(
+        [edges_df[keep], lone_loops_df.assign(alpha=np.nan)], ignore_index=True
+    )
+    with GRAPH_DB_WRITE_LOCK:
+        backbone_df.to_sql(
+            "DDI_GRAPH_BACKBONE", graph_conn, if_exists="replace", index=False
+        )
+        graph_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ddi_graph_backbone_pair "
+            "ON DDI_GRAPH_BACKBONE (drug_a, drug_b)"
+        )
+        graph_conn.commit()
+    graph_conn.close()
+
+    print(
+        f"Backbone (alpha={alpha}): kept {len(backbone_df)} of {n_total} edges "
+        f"({len(backbone_df) / max(n_total, 1):.1%}), "
+        f"dropped {n_total - len(backbone_df)}."
+    )
+    return backbone_df
+
+
+def report_pair_entries(report_drug, block_pairs=PAIR_BLOCK_SIZE):
+    """
+    Yield (report, drug_a, drug_b) arrays, drug_a < drug_b, for every pair of
+    drugs listed in the same report. Pairs are read off the sorted CSR rows of
+    report_drug, grouping reports by their number of drugs k so each group is
+    one upper-triangle gather over a (reports x k) block, with at most about
+    block_pairs pairs built per step.
+    """
+    report_drug = report_drug.tocsr()
+    report_drug.sort_indices()
+    drug_counts = np.diff(report_drug.indptr)
+    for k in np.unique(drug_counts[drug_counts > 1]):
+        upper_a, upper_b = np.triu_indices(k, k=1)
+        reports = np.flatnonzero(drug_counts == k)
+        step = max(1, block_pairs // len(upper_a))
+        for start in range(0, len(reports), step):
+            block = reports[start : start + step]
+            drugs = report_drug.indices[
+                report_drug.indptr[block][:, None] + np.arange(k)
+            ].astype(np.int64)
+            yield (
+                np.repeat(block, len(upper_a)),
+                drugs[:, upper_a].ravel(),
+                drugs[:, upper_b].ravel(),
+            )
+
+
+def build_cooccurrence_tables(
+    db_path,
+    graph_db_path,
+    min_pair_reaction_count=MIN_PAIR_REACTION_COUNT,
+    pair_block_size=PAIR_BLOCK_SIZE,
+):
+    """
+    Count drug pairs and (drug pair, reaction) combinations per report using
+    sparse report x drug and report x reaction incidence matrices, and write
+    them to DDI_PAIRS and DDI_PAIR_REACTIONS next to DDI_GRAPH, with the most
+    reported reactions per pair in DDI_PAIR_TOP_REACTIONS.
+    """
+    conn = sqlite3.connect(db_path)
+    drugs_df = pd.read_sql_query(
+        "SELECT DISTINCT safetyreportid, drug_id FROM DRUGS "
+        "WHERE drug_id IS NOT NULL",
+        conn,
+    )
+    reactions_df = pd.read_sql_query(
+        "SELECT DISTINCT safetyreportid, reaction_id FROM REACTIONS "
+        "WHERE reaction_id IS NOT NULL",
+        conn,
+    )
+    n_drugs = conn.execute("SELECT COUNT(*) FROM DRUG_DICT").fetchone()[0]
+    n_reactions = conn.execute("SELECT COUNT(*) FROM REACTION_DICT").fetchone()[0]
+    severity = load_report_severity(conn)
+
+    graph_conn = connect_graph_db(graph_db_path)
+    with GRAPH_DB_WRITE_LOCK:
+        copy_dictionary("DRUG_DICT", conn, graph_conn)
+        copy_dictionary("REACTION_DICT", conn, graph_conn)
+        graph_conn.commit()
+    conn.close()
+
+    drugs_df["safetyreportid"] = drugs_df["safetyreportid"].astype(str)
+    reactions_df["safetyreportid"] = reactions_df["safetyreportid"].astype(str)
+
+    report_codes, report_ids = pd.factorize(
+        pd.concat([drugs_df["safetyreportid"], reactions_df["safetyreportid"]])
+    )
+    drug_reports = report_codes[: len(drugs_df)]
+    reaction_reports = report_codes[len(drugs_df) :]
+    drug_codes = drugs_df["drug_id"].values
+    reaction_codes = reactions_df["reaction_id"].values
+
+    n_reports = len(report_ids)
+    report_drug = sparse.csr_matrix(
+        (np.ones(len(drug_codes), dtype=np.int32), (drug_reports, drug_codes)),
+        shape=(n_reports, n_drugs),
+    )
+    report_reaction = sparse.csr_matrix(
+        (
+            np.ones(len(reaction_codes), dtype=np.int32),
+            (reaction_reports, reaction_codes),
+        ),
+        shape=(n_reports, n_reactions),
+    )
+    report_severity = severity.reindex(report_ids).fillna(0).values
+
+    # Pair-level counts: D^T D and D^T diag(severity) D, upper triangle only.
+    pair_counts = sparse.triu(report_drug.T @ report_drug, k=1).tocoo()
+    severity_sums = sparse.triu(
+        report_drug.T @ sparse.diags(report_severity, dtype=np.int32) @ report_drug, k=1
+    ).tocsr()
+    pair_a, pair_b = pair_counts.row, pair_counts.col
+    pairs_df = pd.DataFrame(
+        {
+            "drug_a": pair_a,
+            "drug_b": pair_b,
+            "report_count": pair_counts.data,
+            "mean_severity": np.asarray(severity_sums[pair_a, pair_b]).ravel()
+            / pair_counts.data,
+        }
+    )
+
+    # Report x pair incidence, built from the sorted CSR rows of report_drug.
+    pair_keys = pair_a.astype(np.int64) * n_drugs + pair_b
+    key_order = np.argsort(pair_keys)
+    sorted_keys = pair_keys[key_order]
+    incidence_reports, incidence_pairs = [], []
+    for reports, drug_a, drug_b in report_pair_entries(report_drug, pair_block_size):
+        positions = np.searchsorted(sorted_keys, drug_a * n_drugs + drug_b)
+        incidence_reports.append(reports.astype(np.int32))
+        incidence_pairs.append(key_order[positions].astype(np.int32))
+    incidence_reports = np.concatenate(incidence_reports or [np.zeros(0, np.int32)])
+    incidence_pairs = np.concatenate(incidence_pairs or [np.zeros(0, np.int32)])
+    report_pair = sparse.csc_matrix(
+        (
+            np.ones(len(incidence_pairs), dtype=np.int32),
+            (incidence_reports, incidence_pairs),
+        ),
+        shape=(n_reports, len(pair_keys)),
+    )
+    del incidence_reports, incidence_pairs
+
+    with GRAPH_DB_WRITE_LOCK:
+        graph_conn.execute("DROP TABLE IF EXISTS DDI_PAIRS")
+        graph_conn.execute(
+            'CREATE TABLE DDI_PAIRS ("drug_a" INTEGER, "drug_b" INTEGER, '
+            '"report_count" INTEGER, "mean_severity" REAL)'
+        )
+        # written in blocks, as to_sql converts the whole frame to Python objects
+        for start in range(0, len(pairs_df), pair_block_size):
+            pairs_df.iloc[start : start + pair_block_size].to_sql(
+                "DDI_PAIRS", graph_conn, if_exists="append", index=False
+            )
+        graph_conn.execute("DROP TABLE IF EXISTS DDI_PAIR_REACTIONS")
+        graph_conn.execute(
+            'CREATE TABLE DDI_PAIR_REACTIONS ("drug_a" INTEGER, "drug_b" INTEGER, '
+            '"reaction" INTEGER, "report_count" INTEGER)'
+        )
+        graph_conn.commit()
+
+    # (pair, reaction) counts: P^T R, one block of pairs at a time.
+    for start in range(0, len(pair_keys), pair_block_size):
+        block_incidence = report_pair[:, start : start + pair_block_size]
+        block = (block_incidence.T @ report_reaction).tocoo()
+        keep = block.data >= min_pair_reaction_count
+        block_pairs = block.row[keep] + start
+        block_df = pd.DataFrame(
+            {
+                "drug_a": pair_a[block_pairs],
+                "drug_b": pair_b[block_pairs],
+                "reaction": block.col[keep],
+                "report_count": block.data[keep],
+            }
+        )
+        with GRAPH_DB_WRITE_LOCK:
+            block_df.to_sql(
+                "DDI_PAIR_REACTIONS", graph_conn, if_exists="append", index=False
+            )
+
+    with GRAPH_DB_WRITE_LOCK:
+        graph_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ddi_pairs_pair "
+            "ON DDI_PAIRS (drug_a, drug_b)"
+        )
+        graph_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ddi_pair_reactions_pair "
+            "ON DDI_PAIR_REACTIONS (drug_a, drug_b, report_count)"
+        )
+        graph_conn.execute("DROP TABLE IF EXISTS DDI_PAIR_TOP_REACTIONS")
+        graph_conn.execute(
+            "CREATE TABLE DDI_PAIR_TOP_REACTIONS AS "
+            "SELECT drug_a, drug_b, reaction, report_count FROM ("
+            "  SELECT *, ROW_NUMBER() OVER ("
+            "    PARTITION BY drug_a, drug_b ORDER BY report_count DESC, reaction"
+            "  ) AS rank FROM DDI_PAIR_REACTIONS"
+            f") WHERE rank <= {int(TOP_PAIR_REACTIONS)}"
+        )
+        graph_conn.commit()
+    graph_conn.close()
+
+    return pairs_df
 
 
 if __name__ == "__main__":
-    build_ddi_graph("data/fda_data.db")
+    parser = argparse.ArgumentParser(description="Build the DDI graph tables.")
+    parser.add_argument(
+        "--approximate",
+        action="store_true",
+        help="Estimate edge weights with a fixed-size count-min sketch and keep "
+        "only heavy edges (faster, bounded memory)",
+    )
+    parser.add_argument(
+        "--sketch_width_bits",
+        type=int,
+        default=SKETCH_WIDTH_BITS,
+        help=f"log2 of the counters per sketch row (default: {SKETCH_WIDTH_BITS})",
+    )
+    parser.add_argument(
+        "--sketch_depth",
+        type=int,
+        default=SKETCH_DEPTH,
+        help=f"Number of sketch rows (default: {SKETCH_DEPTH})",
+    )
+    parser.add_argument(
+        "--sketch_heavy_hitters",
+        type=int,
+        default=SKETCH_HEAVY_HITTERS,
+        help=f"Candidate edges tracked (default: {SKETCH_HEAVY_HITTERS})",
+    )
+    parser.add_argument(
+        "--sketch_min_weight",
+        type=int,
+        default=SKETCH_MIN_WEIGHT,
+        help=f"Smallest estimated weight written (default: {SKETCH_MIN_WEIGHT})",
+    )
+    parser.add_argument(
+        "--exact_cooccurrence",
+        action="store_true",
+        help="With --approximate: still build the exact DDI_PAIRS tables "
+        "(memory grows with the number of distinct pairs)",
+    )
+    args = parser.parse_args()
+
+    if args.approximate:
+        build_ddi_graph_approx(
+            "data/fda_data.db",
+            width_bits=args.sketch_width_bits,
+            depth=args.sketch_depth,
+            heavy_hitters=args.sketch_heavy_hitters,
+            min_weight=args.sketch_min_weight,
+        )
+    else:
+        build_ddi_graph("data/fda_data.db")
+    build_node_table("data/ddi-graph.db")
+    build_backbone("data/ddi-graph.db")
+    if not args.approximate or args.exact_cooccurrence:
+        build_cooccurrence_tables("data/fda_data.db", "data/ddi-graph.db")
@@ -1,41 +1,351 @@
-import subprocess
-import sys
 import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+STATE_PATH = os.path.join("data", ".pipeline-state.json")
+
+# Seconds to wait for a running stage's write when checking an output table.
+SQLITE_TIMEOUT = 600
+
+def sketch_options(args):
+    """
+    Sketch settings given on the command line, as build_ddi_graph_approx keyword
+    arguments (settings left out use the defaults in graph-preprocessing.py).
+    """
+    options = {
+        "width_bits": args.sketch_width_bits,
+        "depth": args.sketch_depth,
+        "heavy_hitters": args.sketch_heavy_hitters,
+        "min_weight": args.sketch_min_weight,
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
+
+# Each stage declares the script it lives in, the files/directories it reads and
+# writes, and the stages that must finish first. A stage is skipped when the
+# content hashes of its script, parameters and inputs, plus the signatures of the
+# stages it depends on, match its last successful run and all of its outputs are
+# still present. Tables produced by an upstream stage in a shared database are
+# tracked through that stage's signature rather than the database file's hash.
+# Outputs are paths, or "path:TABLE" for a table in a SQLite database, so stages
+# writing different tables of data/ddi-graph.db can run side by side; their
+# writes take turns on the database (see GRAPH_DB_WRITE_LOCK in
+# graph-preprocessing.py). Tables that only one graph build mode writes
+# (DDI_GRAPH_PERIODS, DDI_GRAPH_SKETCH) are left out, as they may not exist.
+STAGES = [
+    {
+        "name": "download",
+        "script": "fda-downloader.py",
+        "run": lambda module, args: module.main(args.max_files),
+        "params": lambda args: {"max_files": args.max_files},
+        "inputs": [],
+        "outputs": ["target"],
+        "deps": [],
+    },
+    {
+        "name": "normalize",
+        "script": "data-normalizer.py",
+        "run": lambda module, args: module.main(args.max_files),
+        "params": lambda args: {"max_files": args.max_files},
+        "inputs": ["target"],
+        "outputs": ["data/fda_data.db"],
+        "deps": ["download"],
+    },
+    {
+        "name": "graph",
+        "script": "graph-preprocessing.py",
+        "run": lambda module, args: (
+            module.build_ddi_graph_approx("data/fda_data.db", **sketch_options(args))
+            if args.approximate_graph
+            else module.build_ddi_graph("data/fda_data.db")
+        ),
+        "params": lambda args: {
+            "approximate": args.approximate_graph,
+            "sketch": sketch_options(args) if args.approximate_graph else {},
+        },
+        "inputs": ["data/fda_data.db"],
+        "outputs": [
+            "data/ddi-graph.db:DDI_GRAPH",
+            "data/ddi-graph.db:DRUG_DICT",
+            "data/ddi-graph.db:DRUG_ALIASES",
+        ],
+        "deps": ["normalize"],
+    },
+    {
+        "name": "nodes",
+        "script": "graph-preprocessing.py",
+        "run": lambda module, args: module.build_node_table("data/ddi-graph.db"),
+        "params": lambda args: {},
+        "inputs": [],
+        "outputs": ["data/ddi-graph.db:DDI_NODES"],
+        "deps": ["graph"],
+    },
+    {
+        "name": "backbone",
+        "script": "graph-preprocessing.py",
+        "run": lambda module, args: module.build_backbone("data/ddi-graph.db"),
+        "params": lambda args: {},
+        "inputs": [],
+        "outputs": ["data/ddi-graph.db:DDI_GRAPH_BACKBONE"],
+        "deps": ["graph"],
+    },
+    {
+        "name": "cooccurrence",
+        "script": "graph-preprocessing.py",
+        "run": lambda module, args: module.build_cooccurrence_tables(
+            "data/fda_data.db", "data/ddi-graph.db"
+        ),
+        "params": lambda args: {},
+        # exact pair counts grow with the number of distinct pairs, so an
+        # approximate build skips them unless asked for
+        "enabled": lambda args: not args.approximate_graph or args.exact_cooccurrence,
+        "inputs": ["data/fda_data.db"],
+        "outputs": [
+            "data/ddi-graph.db:DDI_PAIRS",
+            "data/ddi-graph.db:DDI_PAIR_REACTIONS",
+            "data/ddi-graph.db:DDI_PAIR_TOP_REACTIONS",
+            "data/ddi-graph.db:DRUG_DICT",
+            "data/ddi-graph.db:REACTION_DICT",
+        ],
+        "deps": ["graph"],
+    },
+]
+
+
+def load_state():
+    if os.path.exists(STATE_PATH):
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    else:
+        state = {}
+    state.setdefault("files", {})
+    state.setdefault("stages", {})
+    return state
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    tmp_path = STATE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def file_digest(path, file_cache):
+    """
+    SHA-256 of a file, reusing the cached digest while size and mtime are unchanged.
+    """
+    st = os.stat(path)
+    cached = file_cache.get(path)
+    if (
+        cached
+        and cached["size"] == st.st_size
+        and cached["mtime_ns"] == st.st_mtime_ns
+    ):
+        return cached["sha256"]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    file_cache[path] = {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": h.hexdigest(),
+    }
+    return file_cache[path]["sha256"]
 
-def run_script(script_name, args=None):
+
+def path_digest(path, file_cache):
+    if os.path.isdir(path):
+        h = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                h.update(os.path.relpath(file_path, path).encode())
+                h.update(file_digest(file_path, file_cache).encode())
+        return h.hexdigest()
+    if os.path.exists(path):
+        return file_digest(path, file_cache)
+    return None
+
+
+def input_digests(stage, file_cache):
+    paths = [stage["script"]] + stage["inputs"]
+    return {path: path_digest(path, file_cache) for path in paths}
+
+
+def stage_signature(stage, args, digests, state):
+    payload = {
+        "params": stage["params"](args),
+        "inputs": digests,
+        "deps": {dep: state["stages"].get(dep) for dep in stage["deps"]},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def load_script(script_name, modules):
+    if script_name not in modules:
+        module_name = os.path.splitext(script_name)[0].replace("-", "_")
+        spec = importlib.util.spec_from_file_location(module_name, script_name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        modules[script_name] = module
+    return modules[script_name]
+
+
+def output_exists(output):
+    path, _, table = output.partition(":")
+    if not os.path.exists(path):
+        return False
+    if not table:
+        return True
+    conn = sqlite3.connect(path, timeout=SQLITE_TIMEOUT)
     try:
-        cmd = [sys.executable, script_name]
-        if args:
-            cmd.extend(args)
-        subprocess.check_call(cmd)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running {script_name}: {e}")
-        sys.exit(1)
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def is_up_to_date(stage, signature, state, force):
+    if "all" in force or stage["name"] in force:
+        return False
+    if state["stages"].get(stage["name"]) != signature:
+        return False
+    return all(output_exists(output) for output in stage["outputs"])
+
+
+def run_pipeline(stages, args):
+    state = load_state()
+    file_cache = state["files"]
+    modules = {}
+
+    pending = {stage["name"]: stage for stage in stages}
+    done = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        while pending or running:
+            # Stages writing the same file or table are never run side by side.
+            busy = {
+                output for stage, _ in running.values() for output in stage["outputs"]
+            }
+            skipped = False
+            for name, stage in list(pending.items()):
+                if not set(stage["deps"]) <= done:
+                    continue
+                if busy & set(stage["outputs"]):
+                    continue
+
+                digests = input_digests(stage, file_cache)
+                signature = stage_signature(stage, args, digests, state)
+                if is_up_to_date(stage, signature, state, args.force):
+                    print(f"Skipping {name}: inputs unchanged since last run.")
+                    del pending[name]
+                    done.add(name)
+                    skipped = True
+                    continue
+
+                print(f"Running {name} ({stage['script']})...")
+                module = load_script(stage["script"], modules)
+                future = pool.submit(stage["run"], module, args)
+                running[future] = (stage, signature)
+                busy.update(stage["outputs"])
+                del pending[name]
+
+            if skipped:
+                continue
+            if not running:
+                print(f"Unable to schedule stages: {', '.join(pending)}")
+                sys.exit(1)
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, signature = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error running {stage['name']}: {e}")
+                    save_state(state)
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    sys.exit(1)
+
+                state["stages"][stage["name"]] = signature
+                save_state(state)
+                done.add(stage["name"])
+                print(f"Finished {stage['name']}.")
+
 
 def main():
-    parser = argparse.ArgumentParser(description="Setup dataset by running all preprocessing scripts.")
+    parser = argparse.ArgumentParser(description="Setup dataset by running all preprocessing stages.")
     parser.add_argument(
         '--max_files',
         type=int,
         default=10,
         help='Maximum number of files to process in fda-downloader.py and data-normalizer.py (default: 10)'
     )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=4,
+        help='Maximum number of independent stages to run at once (default: 4)'
+    )
+    parser.add_argument(
+        '--force',
+        action='append',
+        default=[],
+        choices=[stage["name"] for stage in STAGES] + ["all"],
+        help='Rerun a stage even if its inputs are unchanged (repeatable, or "all")'
+    )
+    parser.add_argument(
+        '--approximate_graph',
+        action='store_true',
+        help='Build DDI_GRAPH from a fixed-size count-min sketch, keeping only heavy edges (faster, approximate)'
+    )
+    parser.add_argument(
+        '--sketch_width_bits',
+        type=int,
+        help='With --approximate_graph: log2 of the counters per sketch row'
+    )
+    parser.add_argument(
+        '--sketch_depth',
+        type=int,
+        help='With --approximate_graph: number of sketch rows'
+    )
+    parser.add_argument(
+        '--sketch_heavy_hitters',
+        type=int,
+        help='With --approximate_graph: number of candidate edges tracked'
+    )
+    parser.add_argument(
+        '--sketch_min_weight',
+        type=int,
+        help='With --approximate_graph: smallest estimated edge weight written'
+    )
+    parser.add_argument(
+        '--exact_cooccurrence',
+        action='store_true',
+        help='With --approximate_graph: still build the exact DDI_PAIRS tables (memory grows with the number of pairs)'
+    )
     args = parser.parse_args()
 
-    scripts = [
-        ("fda-downloader.py", ["--max_files", str(args.max_files)]),
-        ("data-normalizer.py", ["--max_files", str(args.max_files)]),
-        ("graph-preprocessing.py", None),
-    ]
-    
-    for script, script_args in scripts:
-        if script_args:
-            args_str = " ".join(script_args)
-            print(f"Running {script} with arguments: {args_str}...")
+    stages = []
+    for stage in STAGES:
+        if stage.get("enabled", lambda args: True)(args):
+            stages.append(stage)
         else:
-            print(f"Running {script}...")
-        run_script(script, script_args)
+            print(f"Skipping {stage['name']}: disabled for this build.")
+    run_pipeline(stages, args)
     print("Dataset setup complete.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()